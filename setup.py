@@ -10,6 +10,7 @@ setup(
     classifiers=["Programming Language :: Python :: 3 :: Only"],
     py_modules=["tap_pardot"],
     install_requires=["singer-python==5.8.1", "requests==2.22.0", "backoff==1.8.0"],
+    extras_require={"http2": ["httpx[http2]"]},
     entry_points="""
     [console_scripts]
     tap-pardot=tap_pardot:main
@@ -1,11 +1,29 @@
 #!/usr/bin/env python3
+import argparse
+import json
+import signal
 import sys
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 
 import singer
 from singer import utils
 
-from tap_pardot.client import Client, InvalidCredentials
+from tap_pardot import retry, state_store, timestamps
+from tap_pardot.business_units import (
+    MultiUnitState,
+    get_business_units,
+    serialized_stdout,
+)
+from tap_pardot.client import Client, InvalidCredentials, TokenManager
+from tap_pardot.metadata_cache import MetadataCache
 from tap_pardot.sync import sync, sync_properties
+from tap_pardot.transport import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_TRANSPORT_RETRIES,
+    build_session,
+)
 
 LOGGER = singer.get_logger()
 
@@ -15,24 +33,271 @@ REQUIRED_CONFIG_KEYS = [
     "refresh_token",
     "client_id",
     "client_secret",
-    "business_unit_id",
 ]
 
 
-@utils.handle_top_exception(LOGGER)
-def main():
-    # Parse command line arguments
+def parse_args():
+    """Parse the tap specific options, then hand the remaining arguments to
+    the standard Singer parser."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--shard", help="Run shard k/N (0-based) of the sync")
+    parser.add_argument(
+        "--shard-until",
+        help="Upper bound shared by all shards, defaults to the start of the hour",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print the quota-aware execution plan as JSON without syncing",
+    )
+    parser.add_argument(
+        "--merge-states",
+        nargs="+",
+        metavar="STATE",
+        help="Merge the final states of all shards and print the result",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep polling prospects and visitor activities instead of exiting",
+    )
+    parser.add_argument(
+        "--refetch",
+        metavar="IDS",
+        help="Re-read only the records with the ids listed per stream in the "
+        "JSON file IDS, leaving bookmarks untouched",
+    )
+    parser.add_argument(
+        "--export-state",
+        action="store_true",
+        help="Print the full state the --state pointer to the state store stands for",
+    )
+    parser.add_argument(
+        "--import-state",
+        metavar="STATE",
+        help="Replace the content of the state store with STATE and print a "
+        "pointer to it",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Write per-stream cProfile stats, collapsed stacks and "
+        "tracemalloc snapshots to DIR",
+    )
+    tap_args, remaining = parser.parse_known_args()
+
+    if tap_args.merge_states:
+        return tap_args, None
+
+    sys.argv = sys.argv[:1] + remaining
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
+    if not args.config.get("business_unit_id") and not args.config.get(
+        "business_units"
+    ):
+        raise Exception(
+            "Config is missing required keys: ['business_unit_id'] or ['business_units']"
+        )
+    return tap_args, args
+
+
+def sync_business_unit(
+    client, config, state, tap_args, shard, profiler, business_unit=None
+):
+    """Plan and sync a business unit, returning its plan."""
+    plan = None
+    if tap_args.plan or config.get("use_planner"):
+        from tap_pardot.planner import build_plan
+        from tap_pardot.registry import select_streams
+
+        plan = build_plan(client, config, state, select_streams(config))
+        LOGGER.info("Execution plan: %s", plan)
+    if tap_args.plan:
+        return plan
+
+    if config.get("refetch"):
+        from tap_pardot.refetch import refetch
 
-    client = Client(**args.config)
+        LOGGER.info("Starting refetch mode")
+        refetch(client, config, config["refetch"], business_unit)
+        client.save_metadata()
+        return plan
+
+    if tap_args.follow or config.get("follow"):
+        from tap_pardot.follow import follow
+
+        LOGGER.info("Starting follow mode")
+        follow(client, config, state, business_unit)
+        client.save_metadata()
+        return plan
 
     LOGGER.info("Starting sync mode")
     try:
-        sync_properties(client)
+        sync_properties(client, business_unit)
     except InvalidCredentials as e:
         LOGGER.exception(e)
         sys.exit(5)
-    sync(client, args.config, args.state)
+    sync(
+        client,
+        config,
+        state,
+        shard=shard,
+        plan=plan,
+        profiler=profiler,
+        business_unit=business_unit,
+    )
+    client.save_metadata()
+    return plan
+
+
+def sync_business_units(units, config, state, tap_args, shard, profiler):
+    """Sync several business units concurrently, each with its own client,
+    quota and sub-state, sharing a single OAuth token and concurrency limit.
+
+    The first unit to fail (including through sys.exit) stops the others at
+    their next page, leaving a resumable state, and its error is raised
+    from the calling thread.
+    """
+    multi_state = MultiUnitState(state)
+    # Refreshes are serialized by the token manager, one connection will do.
+    token_session, _ = build_session(
+        pool_size=1,
+        connect_timeout=config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=config.get("read_timeout", DEFAULT_READ_TIMEOUT),
+        transport_retries=config.get("transport_retries", DEFAULT_TRANSPORT_RETRIES),
+    )
+    token_manager = TokenManager(
+        config["client_id"],
+        config["client_secret"],
+        config["refresh_token"],
+        config.get("access_token"),
+        session=token_session,
+    )
+    concurrency_limiter = retry.ConcurrencyLimiter(
+        config.get("max_concurrent_requests", retry.DEFAULT_MAX_CONCURRENCY)
+    )
+    clients = []
+    stopping = threading.Event()
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: [client.deadline.expire() for client in clients],
+    )
+
+    def sync_unit(unit):
+        with unit.activate(multi_state) as unit_state:
+            LOGGER.info("Syncing business unit %s", unit)
+            client = Client(
+                metadata_cache=MetadataCache.load(unit.config, unit_state),
+                token_manager=token_manager,
+                concurrency_limiter=concurrency_limiter,
+                **unit.config,
+            )
+            clients.append(client)
+            if stopping.is_set():
+                client.deadline.expire()
+            return sync_business_unit(
+                client, unit.config, unit_state, tap_args, shard, profiler, unit
+            )
+
+    workers = config.get("business_unit_concurrency") or len(units)
+    with serialized_stdout(), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(sync_unit, unit): unit.name for unit in units}
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [future for future in done if future.exception() is not None]
+        if failed:
+            LOGGER.error(
+                "Business unit %s failed, stopping the others", futures[failed[0]]
+            )
+            stopping.set()
+            for future in futures:
+                future.cancel()
+            for client in clients:
+                client.deadline.expire()
+    if failed:
+        raise failed[0].exception()
+    return {name: future.result() for future, name in futures.items()}
+
+
+@utils.handle_top_exception(LOGGER)
+def main():
+    # Parse command line arguments
+    tap_args, args = parse_args()
+
+    if tap_args.merge_states:
+        from tap_pardot.sharding import merge_states
+
+        states = [utils.load_json(path) for path in tap_args.merge_states]
+        json.dump(merge_states(states), sys.stdout)
+        sys.stdout.write("\n")
+        return
+
+    timestamps.set_account_timezone(args.config.get("account_timezone"))
+
+    store = None
+    if args.config.get("state_store_path"):
+        keep_versions = args.config.get(
+            "state_store_keep_versions", state_store.DEFAULT_KEEP_VERSIONS
+        )
+        store = state_store.StateStore(args.config["state_store_path"], keep_versions)
+        if tap_args.export_state:
+            json.dump(store.export(args.state), sys.stdout)
+            sys.stdout.write("\n")
+            return
+        if tap_args.import_state:
+            store.load({})
+            store.commit(utils.load_json(tap_args.import_state))
+            json.dump(store.pointer(), sys.stdout)
+            sys.stdout.write("\n")
+            return
+        args.state = store.load(args.state)
+        state_store.use(store)
+    elif tap_args.export_state or tap_args.import_state:
+        raise Exception("--export-state and --import-state require state_store_path")
+
+    shard = None
+    shard_spec = tap_args.shard or args.config.get("shard")
+    if shard_spec:
+        from tap_pardot.sharding import Shard
+
+        shard = Shard.parse(
+            shard_spec, tap_args.shard_until or args.config.get("shard_until")
+        )
+
+    profiler = None
+    profile_dir = tap_args.profile or args.config.get("profile_dir")
+    if profile_dir:
+        from tap_pardot.profiling import DEFAULT_SAMPLE_INTERVAL, Profiler
+
+        profiler = Profiler(
+            profile_dir,
+            args.config.get("profile_interval", DEFAULT_SAMPLE_INTERVAL),
+        )
+
+    if tap_args.refetch:
+        args.config["refetch"] = utils.load_json(tap_args.refetch)
+
+    units = get_business_units(args.config)
+    if units:
+        plan = sync_business_units(
+            units, args.config, args.state, tap_args, shard, profiler
+        )
+    else:
+        metadata_cache = MetadataCache.load(args.config, args.state)
+        client = Client(metadata_cache=metadata_cache, **args.config)
+
+        # Stop at the next page boundary with a resumable state when the
+        # orchestrator asks the container to shut down.
+        signal.signal(signal.SIGTERM, lambda signum, frame: client.deadline.expire())
+
+        plan = sync_business_unit(
+            client, args.config, args.state, tap_args, shard, profiler
+        )
+
+    if tap_args.plan:
+        json.dump(plan, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if store is not None:
+        store.close()
 
 
 if __name__ == "__main__":
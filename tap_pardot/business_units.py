@@ -0,0 +1,120 @@
+import copy
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from tap_pardot import state_store
+
+STATE_KEY = "business_units"
+
+_local = threading.local()
+
+
+def get_business_units(config: Dict) -> List["BusinessUnit"]:
+    """The business units listed in `business_units`, mapping a name to
+    either a business unit id or an object with a `business_unit_id` and
+    config keys overriding the top-level ones for that unit."""
+    units = []
+    for name, unit in (config.get("business_units") or {}).items():
+        if not isinstance(unit, dict):
+            unit = {"business_unit_id": unit}
+        units.append(BusinessUnit(name, {**config, **unit}))
+    return units
+
+
+def write_state(state: Dict):
+    """Write a STATE message, for the whole run when syncing a business unit
+    of a multi business unit run."""
+    unit = getattr(_local, "unit", None)
+    if unit is None:
+        state_store.write_state(state)
+    else:
+        unit.publish()
+
+
+class MultiUnitState:
+    """State of a run over several business units.
+
+    Each unit owns the sub-state under `business_units.<name>` and only
+    updates it from its own thread. STATE messages are composed from the
+    snapshots units publish, so they never read a sub-state mid-update.
+    """
+
+    def __init__(self, state: Dict):
+        self.state = state
+        self.units = state.setdefault(STATE_KEY, {})
+        self.snapshots = copy.deepcopy(self.units)
+        self.lock = threading.Lock()
+
+    def unit_state(self, name: str) -> Dict:
+        return self.units.setdefault(name, {})
+
+    def publish(self, name: str):
+        snapshot = copy.deepcopy(self.units[name])
+        with self.lock:
+            self.snapshots[name] = snapshot
+            state_store.write_state({**self.state, STATE_KEY: dict(self.snapshots)})
+
+
+class SerializedOutput:
+    """File-like wrapper writing to `stream` under a single lock.
+
+    Singer writes each message with a single `write`, so business units
+    syncing from several threads never interleave their messages.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        with self.lock:
+            return self.stream.write(text)
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextmanager
+def serialized_stdout():
+    """Route the messages written to stdout through a SerializedOutput."""
+    stdout = sys.stdout
+    sys.stdout = SerializedOutput(stdout)
+    try:
+        yield sys.stdout
+    finally:
+        sys.stdout = stdout
+
+
+class BusinessUnit:
+    def __init__(self, name: str, config: Dict):
+        self.name = name
+        self.config = config
+        self.business_unit_id = config["business_unit_id"]
+        self.multi_state: Optional[MultiUnitState] = None
+
+    def __str__(self):
+        return f"{self.name} ({self.business_unit_id})"
+
+    def stream_id(self, stream_id: str) -> str:
+        """Records of each unit go to streams prefixed with its name."""
+        return f"{self.name}_{stream_id}"
+
+    def publish(self):
+        self.multi_state.publish(self.name)
+
+    @contextmanager
+    def activate(self, multi_state: MultiUnitState):
+        """Route the STATE messages written by the current thread through
+        `multi_state`."""
+        self.multi_state = multi_state
+        _local.unit = self
+        try:
+            yield multi_state.unit_state(self.name)
+        finally:
+            _local.unit = None
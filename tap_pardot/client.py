@@ -1,11 +1,33 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import backoff
 import requests
 import singer
 from typing import Dict, Tuple, cast
 
+from tap_pardot import retry
+from tap_pardot.deadline import DEFAULT_RUNTIME_MARGIN, Deadline
+from tap_pardot.request_log import (
+    DEFAULT_SAMPLE_RATE,
+    DEFAULT_SUMMARY_INTERVAL,
+    RequestLog,
+)
+from tap_pardot.transport import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_TRANSPORT_RETRIES,
+    TransportStats,
+    build_session,
+)
+
 LOGGER = singer.get_logger()
 
 AUTH_URL = "https://pi.pardot.com/api/login/version/3"
+TOKEN_URL = "https://login.salesforce.com/services/oauth2/token"
 ENDPOINT_BASE = "https://pi.pardot.com/api/"
 
 # Smallest Pardot package has a 25k request limit, so we leave some room
@@ -14,10 +36,19 @@ REQUEST_LIMIT = 20000
 PAGE_SIZE = 200
 
 
+def is_concurrency_error(response: requests.Response) -> bool:
+    if response.ok:
+        return False
+    if response.status_code in retry.CONCURRENCY_ERROR_STATUSES:
+        return True
+    return parse_error(response)[1] in retry.CONCURRENCY_ERROR_CODES
+
+
 def parse_error(response: requests.Response) -> Tuple[str, int]:
     error: str
     code: int
-    if response.headers.get("content-type") != "application/json":
+    content_type = response.headers.get("content-type") or ""
+    if not content_type.startswith("application/json"):
         code = response.status_code
         error = "PardotAPIError: " + response.text
     else:
@@ -28,10 +59,27 @@ def parse_error(response: requests.Response) -> Tuple[str, int]:
     return error, code
 
 
+# "Invalid value specified for limit" and the like, as opposed to the
+# concurrent request and daily rate limit errors.
+INVALID_LIMIT_ERROR = re.compile(r"\binvalid\b.*\blimit\b", re.IGNORECASE)
+
+
+def is_limit_rejection(exc: "PardotException") -> bool:
+    """Whether Pardot refused the `limit` of a query, rather than failing it
+    for another reason."""
+    return (
+        exc.code not in retry.ERROR_CODE_CLASSIFICATION
+        and exc.retry_class == retry.FATAL
+        and INVALID_LIMIT_ERROR.search(str(exc)) is not None
+    )
+
+
 class PardotException(Exception):
     def __init__(self, response: requests.Response):
         message, self.code = parse_error(response)
 
+        self.status_code = response.status_code
+        self.retry_class = retry.classify(self.status_code, self.code)
         self.url = response.request.url
         self.method = response.request.method
         self.raw = response.text
@@ -47,8 +95,57 @@ class RateLimitException(Exception):
     pass
 
 
+class TokenManager:
+    """OAuth access token of one Salesforce identity, shared by the clients
+    of every business unit it syncs. Refreshes are serialized, so a token
+    rejected by several clients at once is only refreshed once."""
+
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        refresh_token,
+        access_token=None,
+        session=None,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.access_token = access_token
+        self.session = session or requests.Session()
+        self.lock = threading.Lock()
+
+    def get(self) -> str:
+        if self.access_token is None:
+            self.refresh(None)
+        return self.access_token
+
+    def refresh(self, stale_token):
+        """Replace `stale_token`, unless another client already did."""
+        with self.lock:
+            if self.access_token is not None and self.access_token != stale_token:
+                return
+
+            data = {
+                "grant_type": "refresh_token",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "refresh_token": self.refresh_token,
+            }
+            headers = {"Content-Type": "application/x-www-form-urlencoded"}
+            response = self.session.post(TOKEN_URL, data=data, headers=headers)
+            data = response.json()
+
+            if response.status_code == 400 and data.get("error") == "invalid_grant":
+                raise InvalidCredentials(f"Invalid Credentials: {data}")
+
+            self.access_token = data.get("access_token")
+            if not self.access_token:
+                LOGGER.warning("failed to refresh token: %s", data)
+                raise PardotException(response)
+
+
 class Client:
-    access_token = None
     refresh_token = None
     client_id = None
     client_secret = None
@@ -57,7 +154,8 @@ class Client:
     get_url = "{}/version/{}/do/query"
 
     num_requests = 0
-    request_limit = REQUEST_LIMIT
+    request_quota = None
+    _request_limit = REQUEST_LIMIT
 
     def __init__(
         self,
@@ -66,95 +164,222 @@ class Client:
         client_secret,
         refresh_token,
         access_token=None,
+        pool_size=DEFAULT_POOL_SIZE,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        transport_retries=DEFAULT_TRANSPORT_RETRIES,
+        http2=False,
+        retry_budget=retry.DEFAULT_RETRY_BUDGET,
+        max_tries=retry.DEFAULT_MAX_TRIES,
+        circuit_threshold=retry.DEFAULT_CIRCUIT_THRESHOLD,
+        circuit_cooldown=retry.DEFAULT_CIRCUIT_COOLDOWN,
+        metadata_cache=None,
+        max_runtime=None,
+        runtime_margin=DEFAULT_RUNTIME_MARGIN,
+        request_quota=None,
+        token_manager=None,
+        request_log_interval=DEFAULT_SUMMARY_INTERVAL,
+        trace_requests=False,
+        request_log_sample_rate=DEFAULT_SAMPLE_RATE,
+        max_concurrent_requests=retry.DEFAULT_MAX_CONCURRENCY,
+        concurrency_limiter=None,
         **kwargs,
     ):
-        self.access_token = access_token
+        self.lock = threading.Lock()
         self.refresh_token = refresh_token
         self.client_id = client_id
         self.client_secret = client_secret
         self.business_unit_id = business_unit_id
-        self.requests_session = requests.Session()
+        self.requests_session, self.transport_adapter = build_session(
+            pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            transport_retries=transport_retries,
+            http2=http2,
+        )
+        self.token_manager = token_manager or TokenManager(
+            client_id,
+            client_secret,
+            refresh_token,
+            access_token,
+            session=self.requests_session,
+        )
+        self.stats = TransportStats()
+        self.request_log = RequestLog(
+            request_log_interval, trace_requests, request_log_sample_rate
+        )
+        self.retry_budget = retry.RetryBudget(retry_budget)
+        self.circuit_breaker = retry.CircuitBreaker(circuit_threshold, circuit_cooldown)
+        self.concurrency_limiter = concurrency_limiter or retry.ConcurrencyLimiter(
+            max_concurrent_requests
+        )
+        self.max_tries = int(max_tries)
+        # Built once, rather than on every request.
+        self._senders = {
+            retry_timeouts: self._retrying_sender(retry_timeouts)
+            for retry_timeouts in (True, False)
+        }
+        self.deadline = Deadline(max_runtime, runtime_margin)
+        self.metadata_cache = metadata_cache
         self.api_version = 4
-        self._set_limit()
-
-    def _get_auth_header(self):
+        if request_quota is not None:
+            self.request_quota = int(request_quota)
+        cached_limit = None
+        if metadata_cache is not None:
+            self.api_version = metadata_cache.get_api_version(business_unit_id) or 4
+            cached_limit = metadata_cache.get_request_limit(business_unit_id)
+        self._limit_known = threading.Event()
+        if cached_limit is not None:
+            self.request_limit = cached_limit
+            self._limit_known.set()
+        else:
+            # Fetched in the background, so that the limits request overlaps
+            # with the describe requests made before syncing.
+            self.request_limit = REQUEST_LIMIT
+            executor = ThreadPoolExecutor(max_workers=1)
+            executor.submit(self._fetch_limit)
+            executor.shutdown(wait=False)
+
+    def _fetch_limit(self):
+        try:
+            self._set_limit()
+        except Exception as e:
+            LOGGER.warning(
+                "Failed to fetch the account limits, allowing %s requests: %s",
+                default_limit(),
+                e,
+            )
+            self.request_limit = default_limit()
+        finally:
+            self._limit_known.set()
+
+    @property
+    def request_limit(self) -> int:
+        """Requests this run may make, once the limits are known."""
+        self._limit_known.wait()
+        with self.lock:
+            return self._request_limit
+
+    @request_limit.setter
+    def request_limit(self, limit: int):
+        if self.request_quota is not None:
+            limit = min(limit, self.request_quota)
+        with self.lock:
+            self._request_limit = limit
+
+    @property
+    def access_token(self):
+        return self.token_manager.access_token
+
+    def _get_auth_header(self, access_token):
         return {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Pardot-Business-Unit-Id": self.business_unit_id,
         }
 
-    @backoff.on_exception(
-        backoff.expo,
-        (
-            requests.exceptions.Timeout,
-            requests.exceptions.ConnectionError,
-            PardotException,
-        ),
-        jitter=None,
-        max_tries=10,
-    )
+    def _giveup(self, exc: Exception, retry_timeouts: bool = True) -> bool:
+        if isinstance(exc, PardotException):
+            if exc.retry_class == retry.GATEWAY_TIMEOUT:
+                return not retry_timeouts or self.retry_budget.exhausted
+            if exc.retry_class not in (retry.RETRYABLE, retry.REFRESH):
+                return True
+        return self.retry_budget.exhausted
+
+    def _on_backoff(self, details):
+        self.retry_budget.spend()
+
+    def _retrying_sender(self, retry_timeouts: bool):
+        return backoff.on_exception(
+            backoff.expo,
+            (
+                requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError,
+                PardotException,
+            ),
+            jitter=backoff.full_jitter,
+            max_tries=self.max_tries,
+            max_value=retry.DEFAULT_MAX_BACKOFF,
+            giveup=lambda exc: self._giveup(exc, retry_timeouts),
+            on_backoff=self._on_backoff,
+        )(self._send_request)
+
     def _make_request(
-        self, method, url, params=None, data=None, activity=None
+        self,
+        method,
+        url,
+        params=None,
+        data=None,
+        activity=None,
+        headers=None,
+        retry_timeouts=True,
     ) -> requests.Response:
-        LOGGER.info(
-            "%s - Making request to %s endpoint %s, with params %s",
-            url,
-            method.upper(),
-            url,
-            params,
-        )
-
-        if self.num_requests >= self.request_limit:
-            raise RateLimitException("Reach daily quota usage limit. Abort.")
+        """Send a request, retrying transient errors. Gateway timeouts are
+        only retried with `retry_timeouts`: callers that can split the query
+        instead handle them themselves."""
+        send = self._senders[retry_timeouts]
+        return send(method, url, params=params, data=data, headers=headers)
+
+    def _send_request(
+        self, method, url, params=None, data=None, headers=None
+    ) -> requests.Response:
+        self.request_log.request(method, url, params)
 
-        if self.access_token is None:
-            self._refresh_access_token()
+        access_token = self.token_manager.get()
 
-        self.num_requests += 1
+        self.circuit_breaker.before_request()
+        with self.lock:
+            # Not waiting for the limits: the limits request itself goes through here.
+            if self.num_requests >= self._request_limit:
+                raise RateLimitException("Reach daily quota usage limit. Abort.")
+            self.num_requests += 1
 
-        response = self.requests_session.request(
-            method, url, headers=self._get_auth_header(), params=params, data=data
+        start = self.concurrency_limiter.acquire()
+        concurrency_error = False
+        try:
+            response = self.requests_session.request(
+                method,
+                url,
+                headers={**self._get_auth_header(access_token), **(headers or {})},
+                params=params,
+                data=data,
+            )
+            concurrency_error = is_concurrency_error(response)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            self.circuit_breaker.record_failure()
+            raise
+        finally:
+            self.concurrency_limiter.release(start, concurrency_error)
+        self.stats.record(response)
+        self.request_log.response(
+            method, url, params, response.status_code, time.monotonic() - start
         )
         if response.ok:
+            self.circuit_breaker.record_success()
             return response
 
-        error, code = parse_error(response)
-        if code == 184:
-            self._refresh_access_token()
+        self.request_log.error(method, url, response.status_code, response.text)
 
-        LOGGER.info(
-            "%s: %s",
-            response.status_code,
-            response.text,
-        )
+        exc = PardotException(response)
+        if exc.retry_class == retry.REFRESH:
+            self.token_manager.refresh(access_token)
+        elif exc.retry_class == retry.GATEWAY_TIMEOUT:
+            self.circuit_breaker.record_failure()
+        elif exc.retry_class == retry.RETRYABLE and not concurrency_error:
+            # Concurrency errors are handled by the concurrency limiter.
+            self.circuit_breaker.record_failure()
 
-        raise PardotException(response)
+        raise exc
 
-    def _refresh_access_token(self):
-        url = "https://login.salesforce.com/services/oauth2/token"
-        data = {
-            "grant_type": "refresh_token",
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "refresh_token": self.refresh_token,
+    def transport_stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.stats.requests,
+            "wire_bytes": self.stats.wire_bytes,
+            "body_bytes": self.stats.body_bytes,
+            "bytes_saved": self.stats.bytes_saved,
+            **self.transport_adapter.connection_stats(),
         }
 
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        response = self.requests_session.post(url, data=data, headers=headers)
-        self.access_token = response.json().get("access_token")
-
-        response = self.requests_session.post(url, data=data, headers=headers)
-        data = response.json()
-
-        if response.status_code == 400 and data.get("error") == "invalid_grant":
-            raise InvalidCredentials(f"Invalid Credentials: {data}")
-
-        self.access_token = data.get("access_token")
-        if not self.access_token:
-            LOGGER.warning("failed to refresh token: %s", response.json())
-            raise PardotException(response)
-
-    def _fetch(self, method, endpoint, format_params, **kwargs):
+    def _fetch(self, method, endpoint, format_params, retry_timeouts=True, **kwargs):
         base_formatting = [endpoint, self.api_version]
         if format_params:
             base_formatting.extend(format_params)
@@ -162,20 +387,45 @@ class Client:
 
         params = {"format": "json", **kwargs}
 
-        response = self._make_request(method, url, params)
-        _, code = parse_error(response)
+        try:
+            response = self._make_request(
+                method, url, params, retry_timeouts=retry_timeouts
+            )
+            _, code = parse_error(response)
+        except PardotException as e:
+            if e.retry_class != retry.VERSION_SWITCH:
+                raise
+            code = e.code
         if code == 89:
             # You have requested version 4 of the API, but this account must use version 3
-            self.api_version = 3
+            self.set_api_version(3)
+            base_formatting[1] = self.api_version
             url = (ENDPOINT_BASE + self.get_url).format(*base_formatting)
-            return self._make_request(method, url, params).json()
+            return self._make_request(
+                method, url, params, retry_timeouts=retry_timeouts
+            ).json()
         return response.json()
 
-    def get(self, endpoint, format_params=None, **kwargs):
-        return self._fetch("get", endpoint, format_params, **kwargs)
+    def set_api_version(self, api_version):
+        self.api_version = api_version
+        if self.metadata_cache is not None:
+            self.metadata_cache.set_api_version(self.business_unit_id, api_version)
+
+    def save_metadata(self):
+        """Record what this run consumed from the cached limits snapshot and
+        persist the metadata cache."""
+        if self.metadata_cache is None:
+            return
+        self.metadata_cache.update_remaining_limit(
+            self.business_unit_id, self.num_requests
+        )
+        self.metadata_cache.save()
+
+    def get(self, endpoint, format_params=None, retry_timeouts=True, **kwargs):
+        return self._fetch("get", endpoint, format_params, retry_timeouts, **kwargs)
 
-    def post(self, endpoint, format_params=None, **kwargs):
-        return self._fetch("post", endpoint, format_params, **kwargs)
+    def post(self, endpoint, format_params=None, retry_timeouts=True, **kwargs):
+        return self._fetch("post", endpoint, format_params, retry_timeouts, **kwargs)
 
     def _set_limit(self):
         try:
@@ -183,16 +433,22 @@ class Client:
                 "get",
                 f"{ENDPOINT_BASE}v5/objects/account?fields=maximumDailyApiCalls,apiCallsUsed",
             )
-            if not response.ok:
-                self.request_limit = default_limit()
+            request_limit = REQUEST_LIMIT
+            if response.ok:
+                request_limit = default_limit()
 
                 data = response.json()
                 maximum_calls = data.get("maximumDailyApiCalls", REQUEST_LIMIT)
                 used_calls = data.get("apiCallsUsed", 0)
                 limit = max(0, maximum_calls - used_calls)
-                self.request_limit = int(limit * 0.8)
+                request_limit = int(limit * 0.8)
         except (ValueError, KeyError, PardotException):
             self.request_limit = default_limit()
+            return
+
+        if self.metadata_cache is not None:
+            self.metadata_cache.set_request_limit(self.business_unit_id, request_limit)
+        self.request_limit = request_limit
 
 
 def default_limit():
@@ -0,0 +1,43 @@
+import time
+from typing import Optional
+
+DEFAULT_RUNTIME_MARGIN = 60
+
+
+class Deadline:
+    """Wall clock budget of a run, set by `max_runtime`.
+
+    Streams check it before every page and stop once less than `margin`
+    seconds plus the slowest page seen so far are left, so the run can end
+    with a resumable state before it gets killed.
+    """
+
+    def __init__(
+        self,
+        max_runtime: Optional[float] = None,
+        margin: float = DEFAULT_RUNTIME_MARGIN,
+        clock=time.monotonic,
+    ):
+        self.clock = clock
+        self.start = clock()
+        self.max_runtime = float(max_runtime) if max_runtime is not None else None
+        self.margin = float(margin)
+        self.slowest = 0.0
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the run must stop, None without a deadline."""
+        if self.max_runtime is None:
+            return None
+        return self.max_runtime - (self.clock() - self.start) - self.margin
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining < self.slowest
+
+    def observe(self, elapsed: float):
+        self.slowest = max(self.slowest, elapsed)
+
+    def expire(self):
+        """End the run at the next page boundary, e.g. on SIGTERM."""
+        self.max_runtime = 0.0
@@ -20,4 +20,28 @@ class TapPardotUnorderedDataException(TapPardotException):
 class TapPardotGatewayTimeoutException(TapPardotException):
 
     def __init__(self, message: str):
-        super().__init__(message, "GATEWAY_TIMEOUT")
\ No newline at end of file
+        super().__init__(message, "GATEWAY_TIMEOUT")
+
+
+class TapPardotBudgetExhaustedException(TapPardotException):
+
+    def __init__(self, message: str):
+        super().__init__(message, "BUDGET_EXHAUSTED")
+
+
+class TapPardotUnknownStreamException(TapPardotException):
+
+    def __init__(self, message: str):
+        super().__init__(message, "UNKNOWN_STREAM")
+
+
+class TapPardotStateStoreException(TapPardotException):
+
+    def __init__(self, message: str):
+        super().__init__(message, "STATE_STORE")
+
+
+class TapPardotRefetchException(TapPardotException):
+
+    def __init__(self, message: str):
+        super().__init__(message, "REFETCH")
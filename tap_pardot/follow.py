@@ -0,0 +1,124 @@
+import time
+
+import singer
+
+from tap_pardot.business_units import write_state
+from tap_pardot.registry import get_stream_class
+from tap_pardot.schema import get_schema, record_transform
+from tap_pardot.sync import output_stream_id
+
+LOGGER = singer.get_logger()
+
+FOLLOW_STREAMS = ["prospects", "visitor_activities"]
+DEFAULT_MIN_INTERVAL = 30
+DEFAULT_MAX_INTERVAL = 600
+
+
+class PollInterval:
+    """Seconds between polls: halved after a poll that found new records,
+    doubled after an idle one."""
+
+    def __init__(
+        self,
+        minimum: float = DEFAULT_MIN_INTERVAL,
+        maximum: float = DEFAULT_MAX_INTERVAL,
+    ):
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.value = self.minimum
+
+    def update(self, new_records: int) -> float:
+        if new_records:
+            self.value = max(self.minimum, self.value / 2)
+        else:
+            self.value = min(self.maximum, self.value * 2)
+        return self.value
+
+
+class Follower:
+    """Polls one stream from the bookmark kept in the in-memory state.
+
+    Streams resume from a bookmark that can repeat the records of its last
+    second (see Prospects.sync_page), so records already emitted at the
+    previous high-water mark are skipped.
+    """
+
+    def __init__(self, client, config, state, stream_id, business_unit=None):
+        self.client = client
+        self.config = config
+        self.state = state
+        self.stream_cls = get_stream_class(stream_id)
+        self.output_id = output_stream_id(stream_id, business_unit)
+        self.key = self.stream_cls.replication_keys[0]
+        self.high_water = None
+        self.seen = set()
+
+        schema = get_schema(client, self.stream_cls)
+        singer.write_schema(self.output_id, schema, self.stream_cls.key_properties)
+        self.transform = record_transform(self.stream_cls, schema)
+
+    def poll(self) -> int:
+        """Emit the records changed since the last poll, returning how many."""
+        high_water, seen = self.high_water, set()
+        new_records = 0
+        for rec in self.stream_cls(self.client, self.config, self.state).sync():
+            value = rec[self.key]
+            if value == self.high_water and rec["id"] in self.seen:
+                continue
+            if high_water is None or value > high_water:
+                high_water, seen = value, set()
+            if value == high_water:
+                seen.add(rec["id"])
+            singer.write_record(self.output_id, self.transform(rec))
+            new_records += 1
+        if new_records:
+            self.high_water, self.seen = high_water, seen
+        return new_records
+
+
+def follow(client, config, state, business_unit=None):
+    """Keep polling the follow streams with the same client until the
+    deadline (max_runtime or SIGTERM) or the request quota is reached. A
+    failed poll is retried at the next one, after a longer wait."""
+    followers = [
+        Follower(client, config, state, stream_id, business_unit)
+        for stream_id in config.get("follow_streams") or FOLLOW_STREAMS
+    ]
+    interval = PollInterval(
+        config.get("follow_min_interval", DEFAULT_MIN_INTERVAL),
+        config.get("follow_max_interval", DEFAULT_MAX_INTERVAL),
+    )
+
+    while True:
+        new_records, failed = 0, False
+        # Each poll gets the whole retry budget. The circuit breaker is left
+        # as it is, so a poll following failures still waits for its cooldown.
+        client.retry_budget.reset()
+        for follower in followers:
+            try:
+                new_records += follower.poll()
+            except (Exception, SystemExit) as exc:
+                # Streams exit with 1 on errors they logged; other codes, such
+                # as invalid credentials, won't be fixed by polling again.
+                if isinstance(exc, SystemExit) and exc.code != 1:
+                    raise
+                LOGGER.warning(
+                    "Polling %s failed, backing off: %s", follower.output_id, exc
+                )
+                failed = True
+        write_state(state)
+
+        wait = interval.update(0 if failed else new_records)
+        LOGGER.info("Followed %s new records, polling again in %ss", new_records, wait)
+        until = time.monotonic() + wait
+        while True:
+            if client.deadline.expired:
+                LOGGER.info("Stopping follow mode: max_runtime reached")
+                return
+            if client.num_requests >= client.request_limit:
+                LOGGER.info("Stopping follow mode: request quota used up")
+                return
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 1))
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import singer
+
+from tap_pardot.business_units import write_state
+
+LOGGER = singer.get_logger()
+
+STATE_KEY = "metadata_cache"
+
+DEFAULT_DESCRIBE_TTL = 24 * 60 * 60
+DEFAULT_LIMITS_TTL = 60 * 60
+
+_file_lock = threading.Lock()
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _read(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        LOGGER.warning("Ignoring unreadable metadata cache at %s", path)
+        return {}
+
+
+class MetadataCache:
+    """Metadata that rarely changes between runs (API version, describe
+    fields, account limits), kept per business unit so warm runs can skip the
+    startup requests.
+
+    The cache lives in the Singer state under `metadata_cache`, unless a
+    `metadata_cache_path` is configured, in which case it is kept in that
+    file instead. In the state, it is taken out of the state while the run
+    goes and only put back by `save()`, so the STATE messages written along
+    the way don't carry it. Generated schemas are only kept in the file; with
+    the state they are cached for the run alone. Saving the file only replaces the business units
+    used through this cache, so it can be shared by the business units of a
+    run.
+    """
+
+    def __init__(
+        self,
+        data: Dict,
+        path: Optional[str] = None,
+        state: Optional[Dict] = None,
+        describe_ttl: float = DEFAULT_DESCRIBE_TTL,
+        limits_ttl: float = DEFAULT_LIMITS_TTL,
+        clock=time.time,
+    ):
+        self.data = data
+        self.path = path
+        self.state = state
+        self.describe_ttl = float(describe_ttl)
+        self.limits_ttl = float(limits_ttl)
+        self._clock = clock
+        self.business_unit_ids = set()
+        self.schemas = {}
+
+    @classmethod
+    def load(cls, config: Dict, state: Dict) -> "MetadataCache":
+        path = config.get("metadata_cache_path")
+        kwargs = {
+            "describe_ttl": config.get("describe_cache_ttl", DEFAULT_DESCRIBE_TTL),
+            "limits_ttl": config.get("limits_cache_ttl", DEFAULT_LIMITS_TTL),
+        }
+        if not path:
+            data = state.pop(STATE_KEY, None) or {}
+            for entry in data.values():
+                entry.pop("schemas", None)
+            return cls(data, state=state, **kwargs)
+
+        return cls(_read(path), path=path, **kwargs)
+
+    def save(self):
+        if not self.path:
+            self.state[STATE_KEY] = self.data
+            write_state(self.state)
+            return
+        with _file_lock:
+            data = _read(self.path)
+            data.update({key: self.data[key] for key in self.business_unit_ids})
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def _entry(self, business_unit_id: str) -> Dict:
+        self.business_unit_ids.add(str(business_unit_id))
+        return self.data.setdefault(str(business_unit_id), {})
+
+    def _is_fresh(self, entry: Optional[Dict], ttl: float) -> bool:
+        return bool(entry) and self._clock() - entry.get("cached_at", 0) < ttl
+
+    def get_api_version(self, business_unit_id: str) -> Optional[int]:
+        return self._entry(business_unit_id).get("api_version")
+
+    def set_api_version(self, business_unit_id: str, api_version: int):
+        self._entry(business_unit_id)["api_version"] = api_version
+
+    def get_describe(self, business_unit_id: str, endpoint: str) -> Optional[Dict]:
+        return self._entry(business_unit_id).get("describe", {}).get(endpoint)
+
+    def is_describe_fresh(self, business_unit_id: str, endpoint: str) -> bool:
+        return self._is_fresh(
+            self.get_describe(business_unit_id, endpoint), self.describe_ttl
+        )
+
+    def set_describe(
+        self,
+        business_unit_id: str,
+        endpoint: str,
+        fields: List[Dict],
+        etag: Optional[str] = None,
+    ):
+        self._entry(business_unit_id).setdefault("describe", {})[endpoint] = {
+            "fields": fields,
+            "etag": etag,
+            "cached_at": self._clock(),
+        }
+
+    def touch_describe(self, business_unit_id: str, endpoint: str):
+        self.get_describe(business_unit_id, endpoint)["cached_at"] = self._clock()
+
+    def _schemas(self, business_unit_id: str) -> Dict:
+        if self.path:
+            return self._entry(business_unit_id).setdefault("schemas", {})
+        return self.schemas.setdefault(str(business_unit_id), {})
+
+    def get_schema(
+        self, business_unit_id: str, stream_name: str, fields_hash: str
+    ) -> Optional[Dict]:
+        entry = self._schemas(business_unit_id).get(stream_name)
+        if not entry or entry["hash"] != fields_hash:
+            return None
+        return entry["schema"]
+
+    def set_schema(
+        self, business_unit_id: str, stream_name: str, fields_hash: str, schema: Dict
+    ):
+        self._schemas(business_unit_id)[stream_name] = {
+            "hash": fields_hash,
+            "schema": schema,
+        }
+
+    def get_request_limit(self, business_unit_id: str) -> Optional[int]:
+        limits = self._entry(business_unit_id).get("limits")
+        if not self._is_fresh(limits, self.limits_ttl) or limits.get("day") != _today():
+            return None
+        return limits["request_limit"]
+
+    def set_request_limit(self, business_unit_id: str, request_limit: int):
+        self._entry(business_unit_id)["limits"] = {
+            "request_limit": request_limit,
+            "day": _today(),
+            "cached_at": self._clock(),
+        }
+
+    def update_remaining_limit(self, business_unit_id: str, requests_made: int):
+        """Carry the snapshot forward by what this run consumed, keeping the
+        original snapshot time so the TTL still bounds its staleness."""
+        limits = self._entry(business_unit_id).get("limits")
+        if not limits or limits.get("day") != _today():
+            return
+        limits["request_limit"] = max(0, limits["request_limit"] - requests_made)
@@ -0,0 +1,86 @@
+from typing import Dict
+
+import singer
+
+from tap_pardot.client import PAGE_SIZE
+
+LOGGER = singer.get_logger()
+
+MIN_PAGE_SIZE = 50
+# Pardot returns at most 200 records per query.
+MAX_PAGE_SIZE = PAGE_SIZE
+# Pages slower than this are halved, as a sign Pardot struggles with the query.
+DEFAULT_TARGET_LATENCY = 30.0
+
+
+def pages_needed(rows: int, page_size: int) -> int:
+    """Requests to page through `rows` records, including the final empty page."""
+    return rows // page_size + 1
+
+
+class PageSizer:
+    """Tunes the `limit` of a stream's queries.
+
+    Requests per record is what the daily quota is spent on, so the size
+    doubles while full pages come back quickly, up to Pardot's maximum of
+    200, until the endpoint returns fewer records than asked for despite
+    having more (its real maximum) or rejects the limit. Slow pages halve it
+    again; gateway timeouts are left to the streams' window splitting.
+    """
+
+    def __init__(
+        self,
+        initial: int = PAGE_SIZE,
+        maximum: int = MAX_PAGE_SIZE,
+        minimum: int = MIN_PAGE_SIZE,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+        auto_tune: bool = True,
+    ):
+        self.minimum = min(int(minimum), MAX_PAGE_SIZE)
+        self.maximum = min(int(maximum), MAX_PAGE_SIZE)
+        self.size = max(self.minimum, min(int(initial), self.maximum))
+        self.target_latency = float(target_latency)
+        self.auto_tune = auto_tune
+        self.last_good = None
+
+    @classmethod
+    def from_config(cls, config: Dict, stream_name: str) -> "PageSizer":
+        page_sizes = config.get("page_sizes") or {}
+        return cls(
+            initial=page_sizes.get(stream_name, config.get("page_size", PAGE_SIZE)),
+            maximum=config.get("max_page_size", MAX_PAGE_SIZE),
+            minimum=config.get("min_page_size", MIN_PAGE_SIZE),
+            target_latency=config.get("page_latency_target", DEFAULT_TARGET_LATENCY),
+            auto_tune=config.get("auto_tune_page_size", True),
+        )
+
+    def _set(self, size: int, reason: str):
+        size = max(self.minimum, min(size, self.maximum))
+        if size != self.size:
+            LOGGER.info("Page size %s -> %s (%s)", self.size, size, reason)
+            self.size = size
+
+    def observe(self, requested: int, returned: int, available: int, elapsed: float):
+        """Feed back a successful page: `available` is the number of matching
+        records from the requested offset onwards."""
+        if not self.auto_tune:
+            return
+
+        if returned < requested and available > returned:
+            self.maximum = max(self.minimum, returned)
+            self._set(returned, "endpoint maximum")
+        elif elapsed > self.target_latency:
+            self._set(requested // 2, f"slow page ({elapsed:.1f}s)")
+        else:
+            self.last_good = requested
+            if returned == requested:
+                self._set(requested * 2, "probing")
+
+    def reject(self) -> bool:
+        """The endpoint refused the current size. Returns False when there is
+        no smaller size known to work."""
+        if self.last_good is None or self.last_good >= self.size:
+            return False
+        self.maximum = self.last_good
+        self._set(self.last_good, "rejected")
+        return True
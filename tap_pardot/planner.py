@@ -0,0 +1,89 @@
+import copy
+from typing import Dict, List, Tuple
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Partially syncing a stream is only worth it with at least this many requests.
+MIN_PARTIAL_REQUESTS = 10
+
+SYNC = "sync"
+PARTIAL = "partial"
+DEFER = "defer"
+
+
+def build_plan(client, config: Dict, state: Dict, stream_objects: List[Tuple]) -> Dict:
+    """Estimate the pending work of every stream and fit it into the
+    remaining request quota and, with `max_runtime`, the time left.
+
+    Streams are considered in sync order (see `registry.select_streams`).
+    Streams that fit are synced, so shorter streams still use what is left
+    after one that doesn't fit. The leftover then goes to the first stream
+    that didn't fit and can resume from its bookmark, which is partially
+    synced, and the rest are deferred.
+    """
+    entries = []
+    latencies = []
+    for stream_id, stream_cls in stream_objects:
+        stream = stream_cls(client, config, copy.deepcopy(state), emit=False)
+        estimate = stream.estimate()
+        latencies.append(estimate.pop("latency"))
+        entries.append(
+            {
+                "stream": stream_id,
+                "supports_partial": stream_cls.supports_partial,
+                **estimate,
+            }
+        )
+
+    latency = sum(latencies) / len(latencies) if latencies else 0
+    quota = max(0, client.request_limit - client.num_requests)
+    remaining = quota
+    time_left = client.deadline.remaining()
+    if time_left is not None and latency:
+        remaining = min(remaining, max(0, int(time_left / latency)))
+
+    for entry in entries:
+        entry["request_budget"] = None
+        if entry["requests"] <= remaining:
+            entry["action"] = SYNC
+            remaining -= entry["requests"]
+        else:
+            entry["action"] = DEFER
+
+    for entry in entries:
+        if (
+            entry["action"] == DEFER
+            and entry["supports_partial"]
+            and remaining >= MIN_PARTIAL_REQUESTS
+        ):
+            entry["action"] = PARTIAL
+            entry["request_budget"] = remaining
+            break
+
+    for entry in entries:
+        entry.pop("supports_partial")
+        requests = entry["request_budget"] or entry["requests"]
+        entry["seconds"] = round(requests * latency, 1)
+
+    planned = [e for e in entries if e["action"] != DEFER]
+    return {
+        "quota": quota,
+        "estimated_requests": sum(
+            e["request_budget"] or e["requests"] for e in planned
+        ),
+        "estimated_seconds": round(sum(e["seconds"] for e in planned), 1),
+        "streams": entries,
+    }
+
+
+def planned_streams(plan: Dict, stream_objects: List[Tuple]):
+    """Yield (stream_id, stream_cls, request_budget) in plan order, skipping
+    deferred streams."""
+    classes = dict(stream_objects)
+    for entry in plan["streams"]:
+        if entry["action"] == DEFER:
+            LOGGER.info("Deferring stream %s to fit the request quota", entry["stream"])
+            continue
+        yield entry["stream"], classes[entry["stream"]], entry["request_budget"]
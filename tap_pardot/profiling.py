@@ -0,0 +1,108 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval, counting
+    collapsed stacks in the format flamegraph tools expect."""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                )
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Writes per-stream profiling artifacts to `output_dir`:
+
+    - `<stream>.pstats`: cProfile statistics, for `python -m pstats` or snakeviz
+    - `<stream>.collapsed`: sampled stacks, for flamegraph.pl or speedscope
+    - `<stream>.tracemalloc`: tracemalloc snapshot taken when the stream ends
+    """
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = float(interval)
+        os.makedirs(output_dir, exist_ok=True)
+        tracemalloc.start()
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.output_dir, f"{name}.{suffix}")
+
+    def checkpoint(self, name: str):
+        tracemalloc.take_snapshot().dump(self._path(name, "tracemalloc"))
+
+    @contextmanager
+    def stream(self, stream_id: str):
+        profile = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        start = time.monotonic()
+
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+
+            profile.dump_stats(self._path(stream_id, "pstats"))
+            sampler.write(self._path(stream_id, "collapsed"))
+            self.checkpoint(stream_id)
+            current, peak = tracemalloc.get_traced_memory()
+            LOGGER.info(
+                "Profiled %s: %.1fs, %s samples, memory %s / peak %s bytes",
+                stream_id,
+                time.monotonic() - start,
+                sum(sampler.stacks.values()),
+                current,
+                peak,
+            )
+            tracemalloc.reset_peak()
+
+
+class NullProfiler:
+    """Profiler used when profiling is disabled, costing nothing per stream."""
+
+    def checkpoint(self, name: str):
+        pass
+
+    @contextmanager
+    def stream(self, stream_id: str):
+        yield
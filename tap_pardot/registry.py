@@ -0,0 +1,60 @@
+import importlib
+from typing import Dict, List, Tuple
+
+from tap_pardot.exceptions import TapPardotUnknownStreamException
+
+DEFAULT_PRIORITY = 100
+
+# Every stream, in default sync order, mapped to its class in tap_pardot.streams.
+# Parents come before their children so that child streams can reuse the
+# parent scan.
+STREAM_REGISTRY = {
+    "prospect_accounts": "ProspectAccounts",
+    "prospects": "Prospects",
+    "campaigns": "Campaigns",
+    "visitor_activities": "VisitorActivities",
+    "visitors": "Visitors",
+    "visits": "Visits",
+    "email_clicks": "EmailClicks",
+    "opportunities": "Opportunities",
+    "users": "Users",
+    "lists": "Lists",
+    "list_memberships": "ListMemberships",
+}
+
+
+def get_stream_class(stream_name: str):
+    """The class of `stream_name`.
+
+    Every sync needs tap_pardot.streams, so importing it here rather than at
+    the top saves nothing on a sync; it only keeps the module off commands
+    that never sync, such as `--merge-states` or `--export-state`.
+    """
+    try:
+        class_name = STREAM_REGISTRY[stream_name]
+    except KeyError:
+        raise TapPardotUnknownStreamException(
+            f"unknown stream {stream_name!r}, expected one of {list(STREAM_REGISTRY)}"
+        ) from None
+    return getattr(importlib.import_module("tap_pardot.streams"), class_name)
+
+
+def select_streams(config: Dict) -> List[Tuple[str, type]]:
+    """Return (stream_name, stream_cls) of the streams to sync, in sync order.
+
+    `streams` (default: all) selects the streams and `exclude_streams` drops
+    some of them. Selected streams are synced by ascending `stream_priorities`
+    (default 100); ties keep the order of `streams`, or the default order.
+    """
+    names = config.get("streams") or list(STREAM_REGISTRY)
+    excluded = set(config.get("exclude_streams") or [])
+    priorities = config.get("stream_priorities") or {}
+    unknown = [n for n in [*names, *excluded, *priorities] if n not in STREAM_REGISTRY]
+    if unknown:
+        raise TapPardotUnknownStreamException(
+            f"unknown streams {unknown}, expected some of {list(STREAM_REGISTRY)}"
+        )
+
+    selected = [name for name in dict.fromkeys(names) if name not in excluded]
+    selected.sort(key=lambda name: priorities.get(name, DEFAULT_PRIORITY))
+    return [(name, get_stream_class(name)) for name in selected]
@@ -0,0 +1,120 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_SUMMARY_INTERVAL = 60
+# Share of the requests logged individually.
+DEFAULT_SAMPLE_RATE = 0.01
+# Characters of an error response body kept in the log.
+ERROR_BODY_LIMIT = 500
+
+
+def truncate(text: str, limit: int = ERROR_BODY_LIMIT) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
+
+
+def log_event(kind: str, level: int, **fields):
+    """Log `fields` as a single JSON line prefixed with `kind`, like the
+    METRIC lines of singer, only building it if the level is enabled."""
+    if LOGGER.isEnabledFor(level):
+        LOGGER.log(level, "%s: %s", kind, json.dumps(fields, default=str))
+
+
+class RequestLog:
+    """Request logging of a client, as structured JSON lines.
+
+    Requests are aggregated per endpoint and summarized every `interval`
+    seconds, and only a `sample_rate` share of them is logged one by one.
+    With `trace` (or the tap logger at DEBUG) every request is logged along
+    with full error bodies.
+    """
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_SUMMARY_INTERVAL,
+        trace: bool = False,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        clock=time.monotonic,
+        rng=random.random,
+    ):
+        self.interval = float(interval)
+        self.trace = trace
+        self.sample_rate = float(sample_rate)
+        self.clock = clock
+        self.rng = rng
+        self.last_summary = clock()
+        self.endpoints = defaultdict(lambda: [0, 0, 0.0])
+        # Clients are shared by the threads of refetch and the limits fetch.
+        self.lock = threading.Lock()
+
+    def _tracing(self) -> bool:
+        return self.trace or LOGGER.isEnabledFor(logging.DEBUG)
+
+    def request(self, method: str, url: str, params):
+        if self._tracing():
+            log_event(
+                "REQUEST",
+                logging.INFO if self.trace else logging.DEBUG,
+                method=method.upper(),
+                url=url,
+                params=params,
+            )
+
+    def response(
+        self, method: str, url: str, params, status_code: int, elapsed: float
+    ):
+        with self.lock:
+            entry = self.endpoints[(method.upper(), url)]
+            entry[0] += 1
+            if status_code >= 400:
+                entry[1] += 1
+            entry[2] += elapsed
+            due = self.clock() - self.last_summary >= self.interval
+        if self._tracing() or self.rng() < self.sample_rate:
+            log_event(
+                "RESPONSE",
+                logging.INFO,
+                method=method.upper(),
+                url=url,
+                params=params,
+                status=status_code,
+                seconds=round(elapsed, 3),
+            )
+        if due:
+            self.summarize()
+
+    def error(self, method: str, url: str, status_code: int, text: str):
+        log_event(
+            "REQUEST_ERROR",
+            logging.INFO,
+            method=method.upper(),
+            url=url,
+            status=status_code,
+            body=text if self._tracing() else truncate(text),
+        )
+
+    def summarize(self):
+        """Log and reset the per-endpoint counters."""
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            self.endpoints.clear()
+            self.last_summary = self.clock()
+        for (method, url), (requests, errors, elapsed) in endpoints:
+            log_event(
+                "REQUEST_SUMMARY",
+                logging.INFO,
+                method=method,
+                url=url,
+                requests=requests,
+                errors=errors,
+                average_seconds=round(elapsed / requests, 3),
+            )
@@ -0,0 +1,198 @@
+import threading
+import time
+from typing import Optional
+
+import singer
+
+LOGGER = singer.get_logger()
+
+RETRYABLE = "retryable"
+REFRESH = "refresh"
+VERSION_SWITCH = "version_switch"
+GATEWAY_TIMEOUT = "gateway_timeout"
+FATAL = "fatal"
+
+# Pardot err_code -> how the client should react. Codes not listed here fall
+# back to the HTTP status classification below.
+ERROR_CODE_CLASSIFICATION = {
+    1: FATAL,  # Invalid API key or user key
+    15: FATAL,  # Login failed
+    66: RETRYABLE,  # Exceeded the concurrent API request limit
+    89: VERSION_SWITCH,  # Account must use a different version of the API
+    122: FATAL,  # Daily API rate limit met
+    181: FATAL,  # Invalid Business Unit ID
+    184: REFRESH,  # Access token is invalid, expired or revoked
+}
+
+STATUS_CLASSIFICATION = {
+    400: FATAL,
+    401: REFRESH,
+    403: FATAL,
+    404: FATAL,
+    429: RETRYABLE,
+    504: GATEWAY_TIMEOUT,
+}
+
+DEFAULT_RETRY_BUDGET = 100
+DEFAULT_MAX_TRIES = 10
+DEFAULT_MAX_BACKOFF = 60
+DEFAULT_CIRCUIT_THRESHOLD = 5
+DEFAULT_CIRCUIT_COOLDOWN = 120
+# Pardot allows 5 concurrent API requests per account.
+DEFAULT_MAX_CONCURRENCY = 5
+# Responses slower than this multiple of the average latency don't grow the
+# concurrency limit.
+DEFAULT_LATENCY_TOLERANCE = 3.0
+
+CONCURRENCY_ERROR_CODES = {66}
+CONCURRENCY_ERROR_STATUSES = {429}
+
+
+def classify(status_code: Optional[int], err_code: Optional[int]) -> str:
+    if err_code in ERROR_CODE_CLASSIFICATION:
+        return ERROR_CODE_CLASSIFICATION[err_code]
+    if status_code in STATUS_CLASSIFICATION:
+        return STATUS_CLASSIFICATION[status_code]
+    # Unknown Pardot errors and 5xx responses are assumed to be transient.
+    return RETRYABLE
+
+
+class RetryBudget:
+    """Caps the number of retries spent over a whole run, so a degraded API
+    cannot silently eat the wall clock and the daily quota."""
+
+    def __init__(self, budget: int = DEFAULT_RETRY_BUDGET):
+        self.budget = int(budget)
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.spent >= self.budget
+
+    def spend(self):
+        with self.lock:
+            self.spent += 1
+        if self.exhausted:
+            LOGGER.warning("Retry budget of %s exhausted", self.budget)
+
+    def reset(self):
+        """Start a new budget, e.g. for the next poll of follow mode."""
+        with self.lock:
+            self.spent = 0
+
+
+class CircuitBreaker:
+    """Pauses requests after `threshold` consecutive failures.
+
+    While the circuit is open, the next request waits for the cooldown to
+    elapse and is then let through as a probe; a success closes the circuit.
+    """
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_CIRCUIT_THRESHOLD,
+        cooldown: float = DEFAULT_CIRCUIT_COOLDOWN,
+        sleep=time.sleep,
+        clock=time.monotonic,
+    ):
+        self.threshold = int(threshold)
+        self.cooldown = float(cooldown)
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+        self._sleep = sleep
+        self._clock = clock
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            failures = self.failures
+            remaining = self.cooldown - (self._clock() - self.opened_at)
+        if remaining > 0:
+            LOGGER.warning(
+                "Circuit open after %s consecutive failures, pausing for %.0fs",
+                failures,
+                remaining,
+            )
+            self._sleep(remaining)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self._clock()
+
+
+class ConcurrencyLimiter:
+    """Additive-increase/multiplicative-decrease limit on requests in flight,
+    shared by every client using the same credentials.
+
+    The limit grows by about one request per round of successful requests
+    that don't come back unusually slow, and is halved when Pardot reports
+    its concurrency limit was exceeded. Requests already in flight when the
+    limit was halved don't halve it again.
+    """
+
+    def __init__(
+        self,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+        clock=time.monotonic,
+    ):
+        self.maximum = int(maximum)
+        self.latency_tolerance = float(latency_tolerance)
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.average_latency = None
+        self.last_decrease = None
+        self.condition = threading.Condition()
+        self._clock = clock
+
+    @property
+    def current(self) -> int:
+        return max(1, int(self.limit))
+
+    def acquire(self) -> float:
+        """Wait for a free slot, returning the start time to release with."""
+        with self.condition:
+            while self.in_flight >= self.current:
+                self.condition.wait()
+            self.in_flight += 1
+            return self._clock()
+
+    def release(self, started: float, concurrency_error: bool = False):
+        now = self._clock()
+        latency = now - started
+        with self.condition:
+            self.in_flight -= 1
+            if concurrency_error:
+                if self.last_decrease is None or started > self.last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+                    LOGGER.info(
+                        "Concurrency limit exceeded, allowing %s requests in flight",
+                        self.current,
+                    )
+            else:
+                slow = (
+                    self.average_latency is not None
+                    and latency > self.average_latency * self.latency_tolerance
+                )
+                if self.average_latency is None:
+                    self.average_latency = latency
+                else:
+                    self.average_latency = 0.9 * self.average_latency + 0.1 * latency
+                if not slow:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
@@ -0,0 +1,249 @@
+import copy
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List
+
+import singer
+
+from tap_pardot.client import ENDPOINT_BASE, Client, PardotException, parse_error
+
+LOGGER = singer.get_logger()
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "schemas")
+
+STRING_TYPE = {"type": ["null", "string"]}
+MULTIPLE_TYPE = {
+    "type": ["null", "array", "string"],
+    "items": {"type": ["null", "string"]},
+}
+# Pardot field types -> JSON schema. Types not listed are emitted as strings.
+FIELD_TYPES = {
+    "number": {"type": ["null", "number"]},
+    "checkbox": MULTIPLE_TYPE,
+    "multi-select": MULTIPLE_TYPE,
+}
+# The customField keys the schema is built from; the rest is not cached.
+CUSTOM_FIELD_KEYS = ("id", "field_id", "name", "type", "is_record_multiple_responses")
+
+
+def load_schema(stream_name: str) -> Dict:
+    with open(os.path.join(SCHEMAS_DIR, f"{stream_name}.json")) as f:
+        return json.load(f)
+
+
+def get_data(data: Dict, path: List) -> Dict:
+    if (not path) or (not data):
+        return data
+    for key in path:
+        data = data.get(key, {})
+        if not data:
+            break
+    return data
+
+
+def describe(client: Client, endpoint: str) -> List[Dict]:
+    """Fetch the describe fields for `endpoint`, served from the metadata cache
+    while it is fresh and revalidated with its ETag once it is not."""
+    cache = client.metadata_cache
+    cached = None
+    if cache is not None:
+        cached = cache.get_describe(client.business_unit_id, endpoint)
+        if cache.is_describe_fresh(client.business_unit_id, endpoint):
+            return cached["fields"]
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+
+    def _describe():
+        return client._make_request(
+            "GET",
+            f"{ENDPOINT_BASE}{endpoint}/version/{client.api_version}/do/describe",
+            params={"format": "json"},
+            headers=headers,
+        )
+
+    try:
+        response = _describe()
+        _, code = parse_error(response)
+    except PardotException as e:
+        if e.code != 89:
+            raise
+        code = e.code
+    if code == 89:
+        # You have requested version 4 of the API, but this account must use version 3
+        client.set_api_version(3)
+        response = _describe()
+
+    if response.status_code == 304 and cached:
+        cache.touch_describe(client.business_unit_id, endpoint)
+        return cached["fields"]
+
+    fields = _as_list(get_data(response.json(), ["result", "field"]))
+    if cache is not None:
+        cache.set_describe(
+            client.business_unit_id, endpoint, fields, response.headers.get("ETag")
+        )
+    return fields
+
+
+def custom_fields(client: Client) -> List[Dict]:
+    """Prospect custom fields, which Pardot exposes through the customField
+    query endpoint rather than a describe call."""
+    cache = client.metadata_cache
+    if cache is not None and cache.is_describe_fresh(
+        client.business_unit_id, "customField"
+    ):
+        return cache.get_describe(client.business_unit_id, "customField")["fields"]
+
+    fields = []
+    offset = 0
+    while True:
+        data = client.get("customField", offset=offset)
+        page = _as_list(get_data(data, ["result", "customField"]))
+        fields.extend(page)
+        offset += len(page)
+        if not page or offset >= int(data["result"].get("total_results", 0)):
+            break
+
+    if cache is not None:
+        cache.set_describe(
+            client.business_unit_id,
+            "customField",
+            [
+                {key: field[key] for key in CUSTOM_FIELD_KEYS if key in field}
+                for field in fields
+            ],
+        )
+    return fields
+
+
+def _as_list(records) -> List[Dict]:
+    if not records:
+        return []
+    if isinstance(records, dict):
+        return [records]
+    return records
+
+
+def field_schema(field: Dict) -> Dict:
+    if str(field.get("is_record_multiple_responses")).lower() == "true":
+        return copy.deepcopy(MULTIPLE_TYPE)
+    field_type = str(field.get("type") or "").lower()
+    return copy.deepcopy(FIELD_TYPES.get(field_type, STRING_TYPE))
+
+
+def fields_hash(fields: List[Dict]) -> str:
+    key = sorted(
+        (field_name(field), field_schema(field)["type"]) for field in fields
+    )
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def field_name(field: Dict) -> str:
+    return field.get("field_id") or field.get("id") or field.get("name")
+
+
+def build_dynamic_schema(base_schema: Dict, fields: List[Dict]) -> Dict:
+    """Extend the static schema with the fields discovered for the account;
+    statically typed properties always win."""
+    schema = copy.deepcopy(base_schema)
+    properties = schema.setdefault("properties", {})
+    for field in fields:
+        name = field_name(field)
+        if name and name not in properties:
+            properties[name] = field_schema(field)
+    return schema
+
+
+FIELD_SOURCES = {
+    "prospect_accounts": lambda client: describe(client, "prospectAccount"),
+    "prospects": custom_fields,
+}
+
+
+def get_schema(client: Client, stream_cls) -> Dict:
+    if not stream_cls.is_dynamic:
+        return load_schema(stream_cls.stream_name)
+    fields = FIELD_SOURCES[stream_cls.stream_name](client)
+    return get_dynamic_schema(client, stream_cls.stream_name, fields)
+
+
+def get_dynamic_schema(client: Client, stream_name: str, fields: List[Dict]) -> Dict:
+    """Generated schemas are cached by the hash of the field set, so they are
+    only rebuilt when fields are added, removed or retyped."""
+    digest = fields_hash(fields)
+    cache = client.metadata_cache
+    if cache is not None:
+        schema = cache.get_schema(client.business_unit_id, stream_name, digest)
+        if schema is not None:
+            return schema
+
+    LOGGER.info("Generating schema for %s from %s fields", stream_name, len(fields))
+    schema = build_dynamic_schema(load_schema(stream_name), fields)
+    if cache is not None:
+        cache.set_schema(client.business_unit_id, stream_name, digest, schema)
+    return schema
+
+
+def _to_number(value):
+    if isinstance(value, str):
+        if value == "":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return value
+
+
+def _to_integer(value):
+    if isinstance(value, str):
+        return int(value) if value != "" else None
+    return value
+
+
+def _to_string(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def compile_transform(schema: Dict) -> Callable[[Dict], Dict]:
+    """Build a record transform from the top level of `schema`: values Pardot
+    returns as strings are cast once per property type, so targets receive
+    records matching the emitted SCHEMA."""
+    casts = []
+    for name, prop in schema.get("properties", {}).items():
+        types = prop.get("type", [])
+        if isinstance(types, str):
+            types = [types]
+        if "object" in types or "array" in types:
+            continue
+        if "integer" in types:
+            casts.append((name, _to_integer))
+        elif "number" in types:
+            casts.append((name, _to_number))
+        elif "string" in types:
+            casts.append((name, _to_string))
+
+    def transform(record: Dict) -> Dict:
+        for name, cast in casts:
+            value = record.get(name)
+            if value is not None:
+                try:
+                    record[name] = cast(value)
+                except ValueError:
+                    pass
+        return record
+
+    return transform
+
+
+def record_transform(stream_cls, schema: Dict) -> Callable[[Dict], Dict]:
+    """Only the records of dynamic streams are cast: their schema is typed
+    from the describe fields, while static streams are emitted as returned."""
+    if not stream_cls.is_dynamic:
+        return lambda record: record
+    return compile_transform(schema)
@@ -0,0 +1,160 @@
+import copy
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import singer
+
+from tap_pardot.business_units import STATE_KEY as BUSINESS_UNITS_KEY
+from tap_pardot.timestamps import format_datetime, parse_datetime
+
+LOGGER = singer.get_logger()
+
+STATE_KEY = "shards"
+
+
+def default_until() -> str:
+    """Start of the current UTC hour, so shards started around the same time
+    agree on the upper bound without further coordination."""
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    return format_datetime(now)
+
+
+class Shard:
+    """Shard `index` of `count` (0-based) of a single tap run.
+
+    Shardable streams are split into `count` contiguous windows between their
+    bookmark and `until`, which must be the same for every shard of a run; the
+    last shard is left open-ended so records arriving during the run are not
+    missed. The window of a shard is stored in its state under `shards`, so a
+    retried shard resumes within the same window.
+    """
+
+    def __init__(self, index: int, count: int, until: Optional[str] = None):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+        self.until = until or default_until()
+
+    @classmethod
+    def parse(cls, spec: str, until: Optional[str] = None) -> "Shard":
+        index, _, count = spec.partition("/")
+        return cls(int(index), int(count), until)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    @property
+    def is_last(self) -> bool:
+        return self.index == self.count - 1
+
+    def split_time(self, start: str, end: str) -> Tuple[str, Optional[str]]:
+        start_dt = parse_datetime(start)
+        step = max(parse_datetime(end) - start_dt, timedelta(0)) / self.count
+        lower = start_dt + step * self.index
+        upper = None if self.is_last else (start_dt + step * (self.index + 1))
+        return (
+            format_datetime(lower),
+            format_datetime(upper) if upper else None,
+        )
+
+    def split_ids(self, start: int, end: int) -> Tuple[int, Optional[int]]:
+        step = max(end - start, 0) // self.count
+        lower = start + step * self.index
+        upper = None if self.is_last else start + step * (self.index + 1)
+        return lower, upper
+
+    def get_window(self, state: Dict, stream_name: str) -> Optional[Dict]:
+        return state.get(STATE_KEY, {}).get(stream_name)
+
+    def set_window(
+        self, state: Dict, stream_name: str, start=None, end=None
+    ) -> Dict:
+        window = {
+            "index": self.index,
+            "count": self.count,
+            "start": start,
+            "end": end,
+            "complete": False,
+        }
+        state.setdefault(STATE_KEY, {})[stream_name] = window
+        LOGGER.info("Shard %s of %s: window %s - %s", self, stream_name, start, end)
+        return window
+
+    def complete(self, state: Dict, stream_name: str):
+        window = self.get_window(state, stream_name)
+        if window is not None:
+            window["complete"] = True
+
+
+def _strip_shards(value):
+    if isinstance(value, dict):
+        return {k: _strip_shards(v) for k, v in value.items() if k != STATE_KEY}
+    return value
+
+
+def merge_states(states: List[Dict]) -> Dict:
+    """Combine the final states of every shard of a run into one state.
+
+    When all shards of a stream completed, each bookmark takes its greatest
+    value across shards. Otherwise the stream resumes from the bookmarks of
+    the first incomplete shard; later shards will be synced again.
+    """
+    if not states:
+        raise ValueError("no shard states to merge")
+
+    if any(BUSINESS_UNITS_KEY in state for state in states):
+        names = {name for state in states for name in state.get(BUSINESS_UNITS_KEY, {})}
+        return {
+            BUSINESS_UNITS_KEY: {
+                name: merge_states(
+                    [
+                        state[BUSINESS_UNITS_KEY][name]
+                        for state in states
+                        if name in state.get(BUSINESS_UNITS_KEY, {})
+                    ]
+                )
+                for name in sorted(names)
+            }
+        }
+
+    by_index = {}
+    for state in states:
+        for window in state.get(STATE_KEY, {}).values():
+            by_index[window["index"]] = state
+            break
+    # Shards that only synced unsharded streams still own index 0.
+    merged = copy.deepcopy(by_index.get(0, states[0]))
+    merged.pop(STATE_KEY, None)
+    bookmarks = merged.setdefault("bookmarks", {})
+
+    stream_names = {name for state in states for name in state.get(STATE_KEY, {})}
+    for stream_name in sorted(stream_names):
+        windows = sorted(
+            (
+                (state[STATE_KEY][stream_name], state)
+                for state in states
+                if stream_name in state.get(STATE_KEY, {})
+            ),
+            key=lambda w: w[0]["index"],
+        )
+        count = windows[0][0]["count"]
+        if [w["index"] for w, _ in windows] != list(range(count)):
+            raise ValueError(f"missing shard states for {stream_name}")
+
+        incomplete = [state for window, state in windows if not window["complete"]]
+        if incomplete:
+            stream_bookmarks = copy.deepcopy(
+                incomplete[0].get("bookmarks", {}).get(stream_name, {})
+            )
+        else:
+            stream_bookmarks = {}
+            for _, state in windows:
+                for key, value in state.get("bookmarks", {}).get(stream_name, {}).items():
+                    if isinstance(value, dict) or value is None:
+                        continue
+                    if key not in stream_bookmarks or value > stream_bookmarks[key]:
+                        stream_bookmarks[key] = value
+        bookmarks[stream_name] = _strip_shards(stream_bookmarks)
+
+    return merged
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import uuid
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple
+
+ITEM_SIZE = array("q").itemsize
+
+
+def spool_path(spool_dir: Optional[str], stream_name: str) -> str:
+    spool_dir = spool_dir or tempfile.gettempdir()
+    os.makedirs(spool_dir, exist_ok=True)
+    return os.path.join(spool_dir, f"tap-pardot-{stream_name}-{uuid.uuid4().hex}.ids")
+
+
+class IdSpool:
+    """Append-only file of 64-bit ids.
+
+    Child streams spool the ids of their parent scan here instead of keeping
+    them in memory, so the child requests can be replayed, resumed at any
+    position, or split over position ranges without querying the parent again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def create(self):
+        open(self.path, "ab").close()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        if not self.exists():
+            return 0
+        return os.path.getsize(self.path) // ITEM_SIZE
+
+    def append(self, ids: Iterable[int]):
+        with open(self.path, "ab") as f:
+            array("q", ids).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def truncate(self, count: int):
+        """Drop ids past `count`, e.g. written by a scan that was interrupted
+        before its progress was recorded."""
+        with open(self.path, "ab") as f:
+            f.truncate(count * ITEM_SIZE)
+
+    def chunks(
+        self, size: int, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[Tuple[int, array]]:
+        """Yield (position after the chunk, ids) for ids in [start, stop)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        with open(self.path, "rb") as f:
+            f.seek(start * ITEM_SIZE)
+            position = start
+            while position < stop:
+                ids = array("q")
+                ids.fromfile(f, min(size, stop - position))
+                position += len(ids)
+                yield position, ids
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,125 @@
+"""Startup benchmark.
+
+Measures what a short incremental run pays before its first query:
+
+- the time to import the tap, in a fresh interpreter;
+- the time from creating the client to knowing the account limits and the
+  prospect account fields, against a simulated API answering every request
+  after `--latency` seconds.
+
+    python -m tap_pardot.startup_benchmark --runs 5 --latency 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from tap_pardot import client as client_module
+from tap_pardot.client import TOKEN_URL, Client
+from tap_pardot.metadata_cache import MetadataCache
+from tap_pardot.sync import sync_properties
+
+RESPONSES = {
+    "token": {"access_token": "token"},
+    "account": {"maximumDailyApiCalls": 25000, "apiCallsUsed": 0},
+    "describe": {"result": {"field": [{"id": "name", "type": "text"}]}},
+}
+
+
+class SimulatedAPI(BaseAdapter):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency)
+        self.requests += 1
+        if request.url.startswith(TOKEN_URL):
+            body = RESPONSES["token"]
+        elif "/objects/account" in request.url:
+            body = RESPONSES["account"]
+        else:
+            body = RESPONSES["describe"]
+
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["content-type"] = "application/json"
+        response.raw = io.BytesIO(json.dumps(body).encode())
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+    def connection_stats(self):
+        return {}
+
+
+def import_time(runs: int) -> float:
+    """Median seconds to import the tap, less the interpreter startup."""
+
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        return time.perf_counter() - start
+
+    baseline = statistics.median(run("pass") for _ in range(runs))
+    return statistics.median(run("import tap_pardot") for _ in range(runs)) - baseline
+
+
+def startup_time(runs: int, latency: float):
+    """Median seconds from creating the client to the end of the startup
+    requests, and the requests made."""
+    timings = []
+    for _ in range(runs):
+        api = SimulatedAPI(latency)
+        session = requests.Session()
+        session.mount("https://", api)
+        build_session = client_module.build_session
+        client_module.build_session = lambda **kwargs: (session, api)
+        try:
+            start = time.perf_counter()
+            client = Client(
+                "business_unit",
+                "client_id",
+                "client_secret",
+                "refresh_token",
+                metadata_cache=MetadataCache({}),
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_properties(client)
+            client.request_limit
+            timings.append(time.perf_counter() - start)
+        finally:
+            client_module.build_session = build_session
+    return statistics.median(timings), api.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    seconds, requests_made = startup_time(args.runs, args.latency)
+    result = {
+        "import_seconds": round(import_time(args.runs), 4),
+        "startup_seconds": round(seconds, 4),
+        "startup_requests": requests_made,
+        "startup_round_trips": round(seconds / args.latency, 1),
+    }
+    json.dump(result, sys.stdout)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""SQLite state store.
+
+With a `state_store_path`, the state of the run is kept in a SQLite database
+and STATE messages only carry a pointer to it, `{"state_store": {"id": ...,
+"version": ...}}`, instead of the whole state.
+
+The state is stored as one row per entry (the bookmarks of a stream, the
+shard windows of a stream, the metadata of a business unit, ...), and each
+write only encodes and inserts the entries that changed, under a new
+version. The last `keep_versions` versions stay readable, so a run resumes
+from exactly the version the target confirmed last, discarding what was
+saved after it; rows superseded before them are pruned as the run goes.
+"""
+import copy
+import json
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import singer
+
+from tap_pardot.exceptions import TapPardotStateStoreException
+
+LOGGER = singer.get_logger()
+
+POINTER_KEY = "state_store"
+
+# Keys of the state holding an entry per stream, business unit id, ...
+SPLIT_KEYS = {"bookmarks", "shards", "metadata_cache"}
+# Keys of the state holding a sub-state per business unit.
+NESTED_KEYS = {"business_units"}
+
+# Versions a pointer can still be resumed from, which should cover the
+# STATE messages a target may hold before confirming one.
+DEFAULT_KEEP_VERSIONS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value TEXT,
+    PRIMARY KEY (path, version)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_store: Optional["StateStore"] = None
+
+
+def write_state(state: Dict):
+    """Write a STATE message for `state`, or save it to the state store in use
+    and write a pointer to it."""
+    if _store is None:
+        singer.write_state(state)
+    else:
+        _store.save(state)
+
+
+def use(store: Optional["StateStore"]):
+    global _store
+    _store = store
+
+
+def flatten(state: Dict, prefix: Tuple = ()) -> Iterator[Tuple[Tuple, Any]]:
+    """Yield (path, value) for the entries of `state`."""
+    for key, value in state.items():
+        path = (*prefix, key)
+        if key in NESTED_KEYS and isinstance(value, dict):
+            for name, sub_state in value.items():
+                yield from flatten(sub_state, (*path, name))
+        elif key in SPLIT_KEYS and isinstance(value, dict):
+            for name, entry in value.items():
+                yield (*path, name), entry
+        else:
+            yield path, value
+
+
+def unflatten(entries: Iterator[Tuple[Tuple, Any]]) -> Dict:
+    state = {}
+    for (*parents, key), value in entries:
+        node = state
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return state
+
+
+def decode(rows) -> Dict[Tuple, Any]:
+    return {tuple(json.loads(path)): json.loads(value) for path, value in rows}
+
+
+class StateStore:
+    def __init__(self, path: str, keep_versions: int = DEFAULT_KEEP_VERSIONS):
+        # Only imported when a store is used, to keep them off the startup path.
+        import sqlite3
+        import uuid
+
+        self.path = path
+        self.keep_versions = max(1, int(keep_versions))
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.id = self._meta("id")
+        if self.id is None:
+            self.id = uuid.uuid4().hex
+            self._set_meta("id", self.id)
+        self.version = int(self._meta("version") or 0)
+        # Oldest version a pointer can be resumed from.
+        self.oldest = int(self._meta("oldest") or 0)
+        # Value of every entry as of `version`.
+        self.saved = decode(self._rows())
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row and row[0]
+
+    def _set_meta(self, key: str, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    def _rows(self):
+        return self.connection.execute(
+            """
+            SELECT path, value FROM entries AS e
+            WHERE version = (SELECT MAX(version) FROM entries WHERE path = e.path)
+              AND value IS NOT NULL
+            """
+        ).fetchall()
+
+    def pointer(self) -> Dict:
+        return {POINTER_KEY: {"id": self.id, "version": self.version}}
+
+    def load(self, state: Dict) -> Dict:
+        """Return the state to start the run from.
+
+        From a pointer, the state saved under its version, forgetting any
+        later version. From a regular state, that state, which replaces the
+        content of the store.
+        """
+        pointer = state.get(POINTER_KEY)
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                if pointer is None:
+                    self.connection.execute("DELETE FROM entries")
+                    self._set_meta("oldest", self.version)
+                elif pointer["id"] != self.id:
+                    raise TapPardotStateStoreException(
+                        f"state points to store {pointer['id']}, "
+                        f"{self.path} is store {self.id}"
+                    )
+                elif int(pointer["version"]) > self.version:
+                    raise TapPardotStateStoreException(
+                        f"state points to version {pointer['version']}, "
+                        f"{self.path} only has {self.version} versions"
+                    )
+                elif int(pointer["version"]) < self.oldest:
+                    raise TapPardotStateStoreException(
+                        f"state points to version {pointer['version']}, pruned "
+                        f"from {self.path}, which keeps versions from {self.oldest}"
+                    )
+                else:
+                    self.version = int(pointer["version"])
+                    self._rollback_to(self.version)
+                self._set_meta("version", self.version)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.oldest = int(self._meta("oldest"))
+            self.saved = decode(self._rows())
+
+        if pointer is None:
+            return state
+        LOGGER.info("Loaded version %s of the state from %s", self.version, self.path)
+        return unflatten(copy.deepcopy(self.saved).items())
+
+    def _rollback_to(self, version: int):
+        """Drop the versions after `version`, and the rows they make obsolete
+        from the versions before."""
+        self.connection.execute("DELETE FROM entries WHERE version > ?", (version,))
+        self._prune(version)
+
+    def _prune(self, horizon: int):
+        """Drop the rows no version from `horizon` on reads."""
+        self.connection.execute(
+            """
+            DELETE FROM entries
+            WHERE version < (
+                SELECT MAX(version) FROM entries AS e
+                WHERE e.path = entries.path AND e.version <= :horizon
+            )
+            """,
+            {"horizon": horizon},
+        )
+        self.connection.execute(
+            "DELETE FROM entries WHERE value IS NULL AND version <= ?", (horizon,)
+        )
+        self._set_meta("oldest", horizon)
+
+    def save(self, state: Dict):
+        """Save `state` and write a pointer to it."""
+        with self.lock:
+            self.commit(state)
+            singer.write_state(self.pointer())
+
+    def commit(self, state: Dict):
+        """Save the entries of `state` that changed since the last save, as a
+        new version, then prune the rows superseded before the versions
+        kept."""
+        changes = {}
+        paths = set()
+        for path, value in flatten(state):
+            paths.add(path)
+            if path not in self.saved or self.saved[path] != value:
+                changes[path] = copy.deepcopy(value)
+        removed = [path for path in self.saved if path not in paths]
+        if not changes and not removed and self.version:
+            return
+
+        version = self.version + 1
+        rows = [
+            (json.dumps(path), version, json.dumps(value, sort_keys=True))
+            for path, value in changes.items()
+        ]
+        rows.extend((json.dumps(path), version, None) for path in removed)
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                "INSERT INTO entries (path, version, value) VALUES (?, ?, ?)", rows
+            )
+            self._set_meta("version", version)
+            horizon = max(self.oldest, version - self.keep_versions)
+            if horizon > self.oldest:
+                self._prune(horizon)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.version = version
+        self.oldest = horizon
+        self.saved.update(changes)
+        for path in removed:
+            del self.saved[path]
+
+    def export(self, state: Dict) -> Dict:
+        """The full state `state` (a pointer to this store) stands for."""
+        pointer = state.get(POINTER_KEY)
+        if pointer is None:
+            return state
+        if pointer["id"] != self.id:
+            raise TapPardotStateStoreException(
+                f"state points to store {pointer['id']}, {self.path} is store {self.id}"
+            )
+        if int(pointer["version"]) < self.oldest:
+            raise TapPardotStateStoreException(
+                f"state points to version {pointer['version']}, pruned "
+                f"from {self.path}, which keeps versions from {self.oldest}"
+            )
+        rows = self.connection.execute(
+            """
+            SELECT path, value FROM entries AS e
+            WHERE version = (
+                SELECT MAX(version) FROM entries
+                WHERE path = e.path AND version <= :version
+            )
+              AND value IS NOT NULL
+            """,
+            {"version": int(pointer["version"])},
+        ).fetchall()
+        return unflatten(decode(rows).items())
+
+    def close(self):
+        self.connection.close()
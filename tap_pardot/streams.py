@@ -1,15 +1,31 @@
 from datetime import datetime, timedelta
-import inspect
+import copy
+import time
 import traceback
 import singer
 import sys
 
-from tap_pardot import exceptions
-from tap_pardot.client import InvalidCredentials, PAGE_SIZE
+from tap_pardot import exceptions, retry
+from tap_pardot.business_units import write_state
+from tap_pardot.client import InvalidCredentials, PardotException, is_limit_rejection
+from tap_pardot.paging import PageSizer, pages_needed
+from tap_pardot.spool import IdSpool, spool_path
+from tap_pardot.timestamps import (
+    add_timedelta,
+    format_datetime,
+    is_after,
+    normalize,
+    parse_datetime,
+    window_midpoint,
+)
 
 
 LOGGER = singer.get_logger()
 
+# Bookmarks holding timestamps, normalized when read so that they compare
+# correctly with the timestamps of records.
+TIME_BOOKMARK_KEYS = {"created_at", "updated_at", "last_updated", "max_updated_at"}
+
 
 class Stream:
     stream_name = None
@@ -20,17 +36,44 @@ class Stream:
     replication_method = None
     is_dynamic = False
 
+    # How the stream is partitioned in shard mode: "time" windows over the
+    # bookmark, "id" ranges, or "parent" windows of the parent stream. Streams
+    # without a shard_kind are only synced by shard 0.
+    shard_kind = None
+    shard_upper_param = None
+
+    # Whether the bookmark always reflects progress, so the stream can stop
+    # after `request_budget` requests and resume from there on the next run.
+    supports_partial = True
+    request_budget = None
+    requests_made = 0
+
+    # Whether records can be read by id range alone, as --refetch does.
+    refetchable = True
+
+    # Whether the stream splits its query window on gateway timeouts, which
+    # are then raised as TapPardotGatewayTimeoutException rather than retried.
+    splits_on_timeout = False
+
     client = None
     config = None
     state = None
+    shard = None
+    shard_window = None
+    # Optional upper bound of the bookmark for time-based streams.
+    until = None
+    # Set when a request budget or max_runtime cut the sync short.
+    stopped_early = False
 
     _last_bookmark_value = None
 
-    def __init__(self, client, config, state, emit=True):
+    def __init__(self, client, config, state, emit=True, shard=None):
         self.client = client
         self.state = state
         self.config = config
         self.emit = emit
+        self.shard = shard
+        self.page_sizer = PageSizer.from_config(config, self.stream_name)
 
     def get_default_start(self):
         return self.config["start_date"]
@@ -39,40 +82,169 @@ class Stream:
         return {}
 
     def get_bookmark(self):
-        return (
+        value = (
             singer.bookmarks.get_bookmark(
                 self.state, self.stream_name, self.replication_keys[0]
             )
             or self.get_default_start()
         )
+        if self.replication_keys[0] in TIME_BOOKMARK_KEYS:
+            value = normalize(value)
+        return value
 
     def update_bookmark(self, bookmark_value):
         singer.bookmarks.write_bookmark(
             self.state, self.stream_name, self.replication_keys[0], bookmark_value
         )
         if self.emit:
-            singer.write_state(self.state)
+            write_state(self.state)
 
     def pre_sync(self):
         """Function to run arbitrary code before a full sync starts."""
+        self.init_shard_window()
 
     def post_sync(self):
         """Function to run arbitrary code after a full sync completes."""
-        singer.write_state(self.state)
+        write_state(self.state)
+
+    def stop_early(self, reason):
+        """Leave a resumable state when a request budget or max_runtime cuts
+        the sync short."""
+        LOGGER.info("Stopping %s early: %s", self.stream_name, reason)
+        self.stopped_early = True
+        write_state(self.state)
+
+    def init_shard_window(self):
+        """Load this shard's window from the state, or compute it from the
+        current bookmark and move the bookmark to the start of the window."""
+        if self.shard is None or self.shard_kind is None:
+            return
+
+        self.shard_window = self.shard.get_window(self.state, self.stream_name)
+        if self.shard_window is not None:
+            return
+
+        start = end = None
+        if self.shard_kind == "time":
+            start, end = self.shard.split_time(self.get_bookmark(), self.shard.until)
+        elif self.shard_kind == "id":
+            start, end = self.shard.split_ids(self.get_bookmark(), self.get_max_id())
+
+        self.shard_window = self.shard.set_window(
+            self.state, self.stream_name, start, end
+        )
+        if start is not None:
+            self.update_bookmark(start)
+
+    def complete_shard(self):
+        if self.shard_window is not None:
+            self.shard.complete(self.state, self.stream_name)
+
+    def get_shard_params(self):
+        end = self.shard_window["end"] if self.shard_window is not None else None
+        if self.until is not None and self.shard_kind == "time":
+            end = self.until if end is None else min(end, self.until)
+        if end is None:
+            return {}
+        if self.shard_kind == "id":
+            return {self.shard_upper_param: end + 1}
+        # Windows overlap by a second, so records on the boundary are not lost.
+        return {self.shard_upper_param: add_timedelta(end, timedelta(seconds=1))}
+
+    def check_budget(self):
+        """Stop the sync before a request that the stream's request budget,
+        max_runtime or the request quota doesn't leave room for."""
+        if self.request_budget is not None and self.requests_made >= self.request_budget:
+            raise exceptions.TapPardotBudgetExhaustedException(
+                f"{self.stream_name} used its budget of {self.request_budget} requests"
+            )
+        if self.client.deadline.expired:
+            raise exceptions.TapPardotBudgetExhaustedException(
+                "max_runtime is about to be reached"
+            )
+        if self.client.num_requests >= self.client.request_limit:
+            raise exceptions.TapPardotBudgetExhaustedException(
+                f"request quota of {self.client.request_limit} used up"
+            )
+
+    def request_page(self, method, params):
+        """Request a page of `page_sizer.size` records, feeding the outcome
+        back to the page sizer. Returns the result and its records."""
+        self.check_budget()
+
+        while True:
+            self.requests_made += 1
+            limit = self.page_sizer.size
+            start = time.monotonic()
+            try:
+                data = self.query(method, {**params, "limit": limit})
+            except PardotException as e:
+                if not is_limit_rejection(e) or not self.page_sizer.reject():
+                    raise
+                continue
+            break
 
-    def get_records(self):
-        data = self.client.get(self.endpoint, **self.get_params())
+        result = data.get("result") or {}
+        records = result.get(self.data_key) or []
+        if isinstance(records, dict):
+            records = [records]
 
-        if data.get("result") is None or data["result"].get("total_results") == 0:
-            return []
+        elapsed = time.monotonic() - start
+        available = int(result.get("total_results") or 0) - params.get("offset", 0)
+        self.page_sizer.observe(limit, len(records), available, elapsed)
+        self.client.deadline.observe(elapsed)
+        return result, records
 
-        records = data["result"][self.data_key]
+    def query(self, method, params):
+        """Query the stream's endpoint. Streams splitting their window on
+        gateway timeouts get them raised at once, rather than retried."""
+        try:
+            return getattr(self.client, method)(
+                self.endpoint, retry_timeouts=not self.splits_on_timeout, **params
+            )
+        except PardotException as e:
+            if self.splits_on_timeout and e.retry_class == retry.GATEWAY_TIMEOUT:
+                raise exceptions.TapPardotGatewayTimeoutException(
+                    f"{e.method} {e.url}: {e}"
+                ) from e
+            raise
+
+    def probe(self, method, params):
+        """First record matching `params` in their sort order, fetched with a
+        single `limit=1` query, or None if there is none."""
+        self.check_budget()
+        self.requests_made += 1
+        data = self.query(method, {**params, "limit": 1})
+        records = (data.get("result") or {}).get(self.data_key) or []
         if isinstance(records, dict):
             records = [records]
+        return self.flatten_value_records(records[0]) if records else None
+
+    def get_records(self, params=None):
+        if params is None:
+            params = self.get_params()
+        _, records = self.request_page("get", params)
 
         for record in sorted(records, key=lambda x: x[self.replication_keys[0]]):
             yield self.flatten_value_records(record)
 
+    def estimate_params(self):
+        params = self.get_params()
+        params.pop("offset", None)
+        return params
+
+    def estimate(self):
+        """Cheaply estimate the rows and requests pending since the bookmark,
+        using a single `limit=1` query for its total_results."""
+        start = time.monotonic()
+        data = self.client.get(self.endpoint, **{**self.estimate_params(), "limit": 1})
+        rows = int((data.get("result") or {}).get("total_results") or 0)
+        return {
+            "rows": rows,
+            "requests": pages_needed(rows, self.page_sizer.size),
+            "latency": time.monotonic() - start,
+        }
+
     def flatten_value_records(self, record):
         """In case when data comes as a dict with 'value' key only."""
         for key, value in record.items():
@@ -116,6 +288,9 @@ class Stream:
                 traceback.format_exc(),
             )
             sys.exit(5)
+        except exceptions.TapPardotBudgetExhaustedException as e:
+            self.stop_early(e)
+            return
         except Exception as exc:
             LOGGER.error(
                 "exception: %s \n traceback: %s",
@@ -125,6 +300,7 @@ class Stream:
             self.post_sync()
             sys.exit(1)
 
+        self.complete_shard()
         self.post_sync()
 
 
@@ -141,6 +317,9 @@ class IdReplicationStream(Stream):
     replication_keys = ["id"]
     replication_method = "INCREMENTAL"
 
+    shard_kind = "id"
+    shard_upper_param = "id_less_than"
+
     def get_default_start(self):
         return 0
 
@@ -149,8 +328,24 @@ class IdReplicationStream(Stream):
             "id_greater_than": self.get_bookmark(),
             "sort_by": "id",
             "sort_order": "ascending",
+            **self.get_shard_params(),
         }
 
+    def get_max_id(self):
+        """Highest id created before the shard upper bound, which is the same
+        for every shard of a run."""
+        data = self.client.get(
+            self.endpoint,
+            created_before=self.shard.until,
+            sort_by="id",
+            sort_order="descending",
+            limit=1,
+        )
+        records = (data.get("result") or {}).get(self.data_key) or []
+        if isinstance(records, dict):
+            records = [records]
+        return int(records[0]["id"]) if records else self.get_bookmark()
+
 
 class CreatedAtReplicationStream(Stream):
     """
@@ -167,11 +362,15 @@ class CreatedAtReplicationStream(Stream):
     replication_keys = ["created_at"]
     replication_method = "INCREMENTAL"
 
+    shard_kind = "time"
+    shard_upper_param = "created_before"
+
     def get_params(self):
         return {
             "created_after": self.get_bookmark(),
             "sort_by": "created_at",
             "sort_order": "ascending",
+            **self.get_shard_params(),
         }
 
 
@@ -189,17 +388,23 @@ class UpdatedAtReplicationStream(Stream):
     replication_keys = ["updated_at"]
     replication_method = "INCREMENTAL"
 
+    shard_kind = "time"
+    shard_upper_param = "updated_before"
+
     def get_params(self):
         return {
             "updated_after": self.get_bookmark(),
             "sort_by": "updated_at",
             "sort_order": "ascending",
+            **self.get_shard_params(),
         }
 
 
 class ComplexBookmarkStream(Stream):
     """Streams that need to keep track of more than 1 bookmark."""
 
+    supports_partial = False
+
     def get_default_start(self, key):
         defaults = {
             "updated_at": self.config["start_date"],
@@ -212,19 +417,22 @@ class ComplexBookmarkStream(Stream):
     def clear_bookmark(self, bookmark_key):
         singer.bookmarks.clear_bookmark(self.state, self.stream_name, bookmark_key)
         if self.emit:
-            singer.write_state(self.state)
+            write_state(self.state)
 
     def get_bookmark(self, bookmark_key):
-        return singer.bookmarks.get_bookmark(
+        value = singer.bookmarks.get_bookmark(
             self.state, self.stream_name, bookmark_key
         ) or self.get_default_start(bookmark_key)
+        if value and bookmark_key in TIME_BOOKMARK_KEYS:
+            value = normalize(value)
+        return value
 
     def update_bookmark(self, bookmark_key, bookmark_value):
         singer.bookmarks.write_bookmark(
             self.state, self.stream_name, bookmark_key, bookmark_value
         )
         if self.emit:
-            singer.write_state(self.state)
+            write_state(self.state)
 
     def sync_page(self):
         raise NotImplementedError("ComplexBookmarkStreams need a custom sync method.")
@@ -241,6 +449,7 @@ class NoUpdatedAtSortingStream(ComplexBookmarkStream):
     - only emit records that have been updated since last sync
     - while iterating thorugh records, keep track of the max updated_at
     - when sync is finished, update the updated_at bookmark with max_updated_at
+    - when sync is stopped early, keep max_updated_at in a bookmark of its own
     """
 
     replication_keys = ["id", "updated_at"]
@@ -252,16 +461,24 @@ class NoUpdatedAtSortingStream(ComplexBookmarkStream):
     def __init__(self, *args, **kwargs):
         super(NoUpdatedAtSortingStream, self).__init__(*args, **kwargs)
         self.last_updated_at = self.get_bookmark("updated_at")
-        self.max_updated_at = self.last_updated_at
+        self.max_updated_at = max(
+            self.last_updated_at,
+            self.get_bookmark("max_updated_at") or self.last_updated_at,
+        )
 
     def post_sync(self):
         self.clear_bookmark("id")
+        self.clear_bookmark("max_updated_at")
         self.update_bookmark("updated_at", self.max_updated_at)
         super(NoUpdatedAtSortingStream, self).post_sync()
 
+    def stop_early(self, reason):
+        self.update_bookmark("max_updated_at", self.max_updated_at)
+        super(NoUpdatedAtSortingStream, self).stop_early(reason)
+
     def get_params(self):
         return {
-            "created_after": self.config["start_date"],
+            "created_after": normalize(self.config["start_date"]),
             "id_greater_than": self.get_bookmark("id"),
             "sort_by": "id",
             "sort_order": "ascending",
@@ -332,8 +549,28 @@ class UpdatedAtSortByIdReplicationStream(ComplexBookmarkStream):
 
 
 class ChildStream(ComplexBookmarkStream):
+    """
+    Streams whose records are queried by the ids of a parent stream.
+
+    Syncing mechanism:
+
+    - scan the parent stream from parent_bookmark and append its ids to an
+      on-disk spool, recording the spool path and id count in the spool bookmark
+    - replay the spool in batches of parent_batch_size ids, keeping track of
+      the position reached in the spool_position bookmark
+    - if the spool file is gone when resuming, rescan the parent from where
+      the spool started
+    - when the parent stream is synced earlier in the same run, its records
+      are fanned out into the spool (see begin_fanout) and only the range
+      before the parent stream's bookmark is scanned, also when resuming a
+      spool of a previous run
+    """
+
     parent_class = None
     parent_id_param = None
+    parent_batch_size = 200
+    # Queries need the ids of parent records besides the id range.
+    refetchable = False
 
     def pre_sync(self):
         self.parent_bookmark = self.get_bookmark("parent_bookmark")
@@ -356,20 +593,8 @@ class ChildStream(ComplexBookmarkStream):
             **self.get_params(),
         }
 
-        data = self.client.post(self.endpoint, **params)
-        self.update_bookmark("offset", params.get("offset", 0) + 200)
-
-        result = data.get("result")
-        if (
-            result is None
-            or result.get("total_results") == 0
-            or result.get(self.data_key) is None
-        ):
-            return []
-
-        records = result.get(self.data_key, [])
-        if isinstance(records, dict):
-            records = [records]
+        _, records = self.request_page("post", params)
+        self.update_bookmark("offset", params.get("offset", 0) + len(records))
 
         return records
 
@@ -377,36 +602,187 @@ class ChildStream(ComplexBookmarkStream):
         for rec in self.get_records(*parent_ids):
             yield rec
 
+    def get_parent_state(self):
+        return self.get_bookmark("parent_bookmark") or {}
+
+    def estimate(self):
+        """Child rows can't be counted up front; every page of parent ids costs
+        at least one child request."""
+        parent = self.parent_class(
+            self.client, self.config, self.get_parent_state(), emit=False
+        )
+        estimate = parent.estimate()
+        estimate["rows"] = None
+        estimate["requests"] *= 2
+        return estimate
+
     def get_parent_ids(self, parent):
         while True:
             parent_ids = [rec["id"] for rec in parent.sync_page()]
             if len(parent_ids):
                 yield parent_ids
-                self.update_bookmark("parent_bookmark", self.parent_bookmark)
             else:
                 break
 
-    def sync(self):
-        self.pre_sync()
+    def open_spool(self):
+        spool_state = self.get_bookmark("spool")
+        if spool_state is not None:
+            spool = IdSpool(spool_state["path"])
+            fanout = spool_state.get("fanout")
+            if spool.exists() and (fanout is None or fanout["complete"]):
+                spool.truncate(spool_state["count"])
+                return spool
+
+            if fanout is not None and not fanout["complete"]:
+                LOGGER.warning(
+                    "Fan-out into %s was interrupted, rescanning its parents",
+                    self.stream_name,
+                )
+                spool.remove()
+            else:
+                LOGGER.warning(
+                    "Spool %s is gone, rescanning %s parents",
+                    spool.path,
+                    self.stream_name,
+                )
+            self.parent_bookmark.clear()
+            self.parent_bookmark.update(copy.deepcopy(spool_state["parent_start"]))
+            self.clear_bookmark("spool_position")
+
+        spool = IdSpool(spool_path(self.config.get("spool_dir"), self.stream_name))
+        spool.create()
+        self.update_bookmark(
+            "spool",
+            {
+                "path": spool.path,
+                "count": 0,
+                "complete": False,
+                "parent_start": copy.deepcopy(self.parent_bookmark),
+            },
+        )
+        return spool
 
+    def spool_parent_ids(self, spool):
+        spool_state = self.get_bookmark("spool")
         parent = self.parent_class(
-            self.client, self.config, self.parent_bookmark, emit=False
+            self.client,
+            self.config,
+            self.parent_bookmark,
+            emit=False,
+            shard=self.shard if self.shard_kind == "parent" else None,
         )
+        parent.init_shard_window()
 
-        for parent_ids in self.get_parent_ids(parent):
-            records_synced = 0
-            last_records_synced = -1
+        fanout = spool_state.get("fanout")
+        if fanout is not None:
+            # The parent stream already fed everything after its bookmark.
+            parent.until = fanout["until"]
 
-            while records_synced != last_records_synced:
-                last_records_synced = records_synced
-                for rec in self.sync_page(parent_ids):
-                    records_synced += 1
-                    yield rec
-            self.clear_bookmark("offset")
+        if fanout is None or parent.get_bookmark() < fanout["until"]:
+            for parent_ids in self.get_parent_ids(parent):
+                spool.append(parent_ids)
+                spool_state["count"] += len(parent_ids)
+                self.update_bookmark("spool", spool_state)
+
+        spool_state["complete"] = True
+        self.update_bookmark("spool", spool_state)
+
+    def sync_parent_batch(self, parent_ids):
+        return self.sync_page(parent_ids)
+
+    def begin_fanout(self, parent_bookmark):
+        """Start receiving the records of the parent stream synced earlier in
+        the same run from `parent_bookmark`, instead of scanning it again.
+
+        A spool left in progress by a previous run is resumed, with its scan of
+        the parent reopened up to `parent_bookmark` so that it meets the
+        records fanned out in this run.
+        """
+        self.pre_sync()
+        resuming = self.get_bookmark("spool") is not None
+        spool = self.open_spool()
+        spool_state = self.get_bookmark("spool")
+        scan_start = self.parent_class(
+            self.client, self.config, spool_state["parent_start"], emit=False
+        ).get_bookmark()
+        if resuming and spool_state["complete"]:
+            # The scan stopped where the parent stood back then.
+            spool_state["complete"] = False
+        spool_state["fanout"] = {"until": parent_bookmark, "complete": False}
+        self.update_bookmark("spool", spool_state)
+        return ParentFanOut(self, spool, scan_start)
+
+    def sync(self):
+        self.pre_sync()
 
+        try:
+            spool = self.open_spool()
+            if not self.get_bookmark("spool")["complete"]:
+                self.spool_parent_ids(spool)
+
+            start = self.get_bookmark("spool_position") or 0
+            for position, parent_ids in spool.chunks(self.parent_batch_size, start):
+                records_synced = 0
+                last_records_synced = -1
+
+                while records_synced != last_records_synced:
+                    last_records_synced = records_synced
+                    for rec in self.sync_parent_batch(parent_ids.tolist()):
+                        records_synced += 1
+                        yield rec
+                # Bookmarks paging through a batch don't carry over to the next one.
+                self.clear_bookmark("offset")
+                self.clear_bookmark("id")
+                self.update_bookmark("spool_position", position)
+        except exceptions.TapPardotBudgetExhaustedException as e:
+            self.stop_early(e)
+            return
+
+        spool.remove()
+        self.clear_bookmark("spool")
+        self.clear_bookmark("spool_position")
+        self.complete_shard()
         self.post_sync()
 
 
+class ParentFanOut:
+    """Appends the ids of parent records emitted by the parent stream to a
+    child stream's spool, skipping those the child's own scan wouldn't see."""
+
+    flush_size = 10000
+
+    def __init__(self, child, spool, scan_start):
+        self.child = child
+        self.spool = spool
+        self.scan_start = scan_start
+        self.ids = []
+
+    def add(self, record):
+        if record["updated_at"] > self.scan_start:
+            self.ids.append(record["id"])
+            if len(self.ids) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        spool_state = self.child.get_bookmark("spool")
+        if self.ids:
+            self.spool.append(self.ids)
+            spool_state["count"] += len(self.ids)
+            self.ids = []
+        self.child.update_bookmark("spool", spool_state)
+
+    def finish(self):
+        self.child.get_bookmark("spool")["fanout"]["complete"] = True
+        self.flush()
+
+    def abandon(self):
+        """Drop the spool of a parent sync that stopped early, leaving the
+        child stream to scan its parents itself."""
+        self.ids = []
+        self.spool.remove()
+        self.child.clear_bookmark("spool")
+
+
 class EmailClicks(IdReplicationStream):
     stream_name = "email_clicks"
     data_key = "emailClick"
@@ -423,32 +799,90 @@ class VisitorActivities(CreatedAtReplicationStream):
     # to fetching too much data. Data science is only using some types of visitor
     # activities. Hence, we can filter out the used ones only.
     filter_types = "1,2,4,6,17,21,24,25,26,27,28,29,34"
-    datetime_format = "%Y-%m-%d %H:%M:%S"
+
+    # Size of the created_at window requested at once. It is halved whenever
+    # Pardot answers with a gateway timeout and grows back after successes.
+    max_window = timedelta(days=7)
+    min_window = timedelta(hours=1)
+    window = max_window
+    splits_on_timeout = True
+
+    # created_after of the last window queried again after a probe found an
+    # activity the window query had missed.
+    _requeried_from = None
+
+    def split_window(self):
+        if self.window <= self.min_window:
+            raise exceptions.TapPardotGatewayTimeoutException(
+                f"window of {self.window} still times out, giving up"
+            )
+        self.window = self.window / 2
+        LOGGER.warning("Gateway timeout, reducing window to %s", self.window)
 
     def get_params(self):
         p = CreatedAtReplicationStream.get_params(self)
-        try:
-            created_after_dt = datetime.strptime(
-                p["created_after"], self.datetime_format
-            )
-        except ValueError:
-            p["created_after"] += " 00:00:00"
-            created_after_dt = datetime.strptime(
-                p["created_after"], self.datetime_format
-            )
 
         # In order to avoid timeouts, we need to drastically limit the amount of activities that we
         # ask Pardot to process per request.
-        cb = created_after_dt + timedelta(days=7)
+        cb = parse_datetime(p["created_after"]) + self.window
+        shard_end = p.get("created_before")
+        if shard_end is not None:
+            cb = min(cb, parse_datetime(shard_end))
 
-        p.update(
-            type=self.filter_types, created_before=cb.strftime(self.datetime_format)
-        )
+        p.update(type=self.filter_types, created_before=format_datetime(cb))
 
         return p
 
-    def sync_page(self):
-        for rec in self.get_records():
+    def next_window_start(self, params):
+        """Where to resume after the window `params` asked for came back
+        empty: right before the next activity a probe finds, or the end of
+        the window when the probe fails. None when no activity is left."""
+        # Resume a second early, as created_after leaves out its own second.
+        window_end = add_timedelta(params["created_before"], timedelta(seconds=-1))
+        probe_params = CreatedAtReplicationStream.get_params(self)
+        probe_params["type"] = self.filter_types
+        try:
+            record = self.probe("get", probe_params)
+        except exceptions.TapPardotGatewayTimeoutException:
+            LOGGER.warning("Gateway timeout probing for the next activity")
+            return window_end
+
+        if record is None:
+            return None
+
+        next_created_at = add_timedelta(record["created_at"], timedelta(seconds=-1))
+        if next_created_at >= window_end:
+            if next_created_at > window_end:
+                LOGGER.info(
+                    "No activities between %s and %s, skipping ahead",
+                    params["created_after"],
+                    next_created_at,
+                )
+            return next_created_at
+
+        # The probe found an activity the window query missed: query the
+        # window again from right before it, once.
+        if self._requeried_from != params["created_after"]:
+            self._requeried_from = params["created_after"]
+            return max(next_created_at, params["created_after"])
+        return window_end
+
+    def estimate(self):
+        """Every window costs at least one request, on top of the pages, and
+        gaps between activities cost a window and a probe."""
+        estimate = super().estimate()
+        created_after = parse_datetime(self.get_params()["created_after"])
+        windows = max(1, (datetime.now() - created_after) // self.max_window + 1)
+        estimate["requests"] += min(windows, 2 * estimate["rows"] + 1)
+        return estimate
+
+    def estimate_params(self):
+        params = super().estimate_params()
+        params.pop("created_before")
+        return {**params, **self.get_shard_params()}
+
+    def sync_page(self, params):
+        for rec in self.get_records(params):
             yield rec
             current_bookmark_value = rec[self.replication_keys[0]]
             if self._last_bookmark_value is None:
@@ -462,6 +896,9 @@ class VisitorActivities(CreatedAtReplicationStream):
 
         try:
             now = datetime.now()
+            shard_end = self.get_shard_params().get("created_before")
+            if shard_end is not None:
+                now = min(now, parse_datetime(shard_end))
 
             # Since we're now synchronizing visitor activities in timed windows, we need to account
             # for the case where a given window has no data.
@@ -470,16 +907,27 @@ class VisitorActivities(CreatedAtReplicationStream):
                 # need to actually short circuit break when there are no more records.
                 n = 0
 
-                for rec in self.sync_page():
-                    n += 1
-                    yield rec
+                # The window is only known once the query ran: it changes with
+                # the bookmark and the window size.
+                params = self.get_params()
+                try:
+                    for rec in self.sync_page(params):
+                        n += 1
+                        yield rec
+                except exceptions.TapPardotGatewayTimeoutException:
+                    self.split_window()
+                    continue
 
-                if n == 0 and now < datetime.strptime(
-                    self.get_params()["created_before"], self.datetime_format
-                ):
-                    break
                 if n == 0:
-                    self.update_bookmark(self.get_params()["created_before"])
+                    if now <= parse_datetime(params["created_before"]):
+                        break
+                    window_start = self.next_window_start(params)
+                    if window_start is None:
+                        break
+                    self.update_bookmark(window_start)
+
+                # Grow back only once the bookmark moved past the window.
+                self.window = min(self.window * 2, self.max_window)
 
         except InvalidCredentials as e:
             LOGGER.error(
@@ -488,6 +936,9 @@ class VisitorActivities(CreatedAtReplicationStream):
                 traceback.format_exc(),
             )
             sys.exit(5)
+        except exceptions.TapPardotBudgetExhaustedException as e:
+            self.stop_early(e)
+            return
         except Exception as exc:
             LOGGER.error(
                 "exception: %s \n traceback: %s",
@@ -497,6 +948,7 @@ class VisitorActivities(CreatedAtReplicationStream):
             self.post_sync()
             sys.exit(1)
 
+        self.complete_shard()
         self.post_sync()
 
     is_dynamic = False
@@ -515,7 +967,7 @@ class Prospects(UpdatedAtReplicationStream):
     data_key = "prospect"
     endpoint = "prospect"
 
-    is_dynamic = False
+    is_dynamic = True
 
     def sync_page(self):
         bookmark = self.get_bookmark()
@@ -525,31 +977,23 @@ class Prospects(UpdatedAtReplicationStream):
         }
 
         while True:
-            data = self.client.get(self.endpoint, **params)
-            records = data.get("result", {}).get(self.data_key)
+            _, records = self.request_page("get", params)
 
             if not records:
                 break
-            if isinstance(records, dict):
-                records = [records]
 
             for record in sorted(records, key=lambda x: x[self.replication_keys[0]]):
                 bookmark = record[self.replication_keys[0]]
 
                 yield self.flatten_value_records(record)
 
-            params["offset"] += 200
+            params["offset"] += len(records)
 
             # Since the updated_after query filter is exclusive, we need to consider the case where
             # the last record of page N has the same updated_at value as the first record of page N+1.
             # Since Pardot's smallest unit of time is seconds, we simply deduct one second, guaranteeing
             # that, should page N+1 fail, then we will never lose any records.
-            bookmark = datetime.strptime(bookmark, "%Y-%m-%d %H:%M:%S") - timedelta(
-                seconds=1
-            )
-            bookmark = bookmark.strftime("%Y-%m-%d %H:%M:%S")
-
-            self.update_bookmark(bookmark)
+            self.update_bookmark(add_timedelta(bookmark, timedelta(seconds=-1)))
 
     def sync(self):
         self.pre_sync()
@@ -562,6 +1006,9 @@ class Prospects(UpdatedAtReplicationStream):
                 traceback.format_exc(),
             )
             sys.exit(5)
+        except exceptions.TapPardotBudgetExhaustedException as e:
+            self.stop_early(e)
+            return
         except Exception as exc:
             LOGGER.error(
                 "exception: %s \n traceback: %s",
@@ -571,6 +1018,7 @@ class Prospects(UpdatedAtReplicationStream):
             self.post_sync()
             sys.exit(1)
 
+        self.complete_shard()
         self.post_sync()
 
 
@@ -603,6 +1051,7 @@ class Visitors(UpdatedAtReplicationStream):
             "sort_by": "updated_at",
             "sort_order": "ascending",
             "only_identified": "false",
+            **self.get_shard_params(),
         }
 
     def sync_page(self):
@@ -666,26 +1115,48 @@ class Visits(ChildStream, NoUpdatedAtSortingStream):
     parent_class = Visitors
     parent_id_param = "visitor_ids"
 
+    shard_kind = "parent"
+
+    def get_parent_state(self):
+        return self.get_bookmark("parent_bookmark") or {
+            "bookmarks": {
+                self.parent_class.stream_name: {
+                    "updated_at": self.get_bookmark("updated_at")
+                }
+            }
+        }
+
     def pre_sync(self):
         self.parent_bookmark = self.get_bookmark("parent_bookmark")
 
         if self.parent_bookmark is None:
-            self.parent_bookmark = {
-                "bookmarks": {
-                    self.parent_class.stream_name: {
-                        "updated_at": self.get_bookmark("updated_at")
-                    }
-                }
-            }
+            self.parent_bookmark = self.get_parent_state()
 
             self.update_bookmark("parent_bookmark", self.parent_bookmark)
         super(ChildStream, self).pre_sync()
 
+    # With `split_page_views`, page views are taken out of visits and handed
+    # to this callable one by one, to be written to their own stream.
+    page_view_sink = None
+
     def fix_page_views(self, record):
         page_views = (record.get("visitor_page_views") or {}).get("visitor_page_view")
         if isinstance(page_views, dict):
             record["visitor_page_views"]["visitor_page_view"] = [page_views]
 
+    def pop_page_views(self, record):
+        """Remove the page views from `record`, returning them keyed by the visit."""
+        page_views = (record.pop("visitor_page_views", None) or {}).get(
+            "visitor_page_view"
+        ) or []
+        if isinstance(page_views, dict):
+            page_views = [page_views]
+        for page_view in page_views:
+            page_view["visit_id"] = record["id"]
+            page_view["visitor_id"] = record.get("visitor_id")
+            page_view["prospect_id"] = record.get("prospect_id")
+        return page_views
+
     def sync_page(self, parent_ids):
         """
         Visits uses offset to paginate through.
@@ -695,9 +1166,16 @@ class Visits(ChildStream, NoUpdatedAtSortingStream):
         for rec in self.get_records(*parent_ids):
             if rec["updated_at"] <= self.last_updated_at:
                 continue
-            self.fix_page_views(rec)
             self.max_updated_at = max(self.max_updated_at, rec["updated_at"])
+            if self.page_view_sink is None:
+                self.fix_page_views(rec)
+                yield rec
+                continue
+
+            page_views = self.pop_page_views(rec)
             yield rec
+            for page_view in page_views:
+                self.page_view_sink(page_view)
 
 
 class Lists(UpdatedAtReplicationStream):
@@ -727,7 +1205,7 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
 
         # In order to avoid timeouts, we need to drastically limit the amount of memberships that we
         # ask Pardot to process per request.
-        updated_after = self.get_bookmark("updated_at") or self.config["start_date"]
+        updated_after = self.get_bookmark("updated_at")
         return {
             # Even though we can't sort by updated_at, we can
             # filter by updated_after
@@ -738,17 +1216,26 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
             "sort_order": "ascending",
         }
 
-    def get_parent_ids(self, parent):
-        """ListMemberships take only 1 parent id at a time."""
-        records_synced = 0
-        last_records_synced = -1
-
-        while records_synced != last_records_synced:
-            last_records_synced = records_synced
-            for rec in parent.sync_page():
-                records_synced += 1
-                yield rec["id"]
-                self.update_bookmark("parent_bookmark", self.parent_bookmark)
+    def estimate(self):
+        """Every list is queried once per window since the bookmark."""
+        parent = self.parent_class(
+            self.client, self.config, self.get_parent_state(), emit=False
+        )
+        estimate = parent.estimate()
+        updated_after = self.get_bookmark("updated_at")
+        days = (datetime.now() - parse_datetime(updated_after)).days
+        windows = max(1, days // 60 + 1)
+        lists = estimate["rows"]
+        estimate["rows"] = None
+        estimate["requests"] += lists * windows
+        return estimate
+
+    # ListMemberships take only 1 parent id at a time.
+    parent_batch_size = 1
+    splits_on_timeout = True
+
+    def sync_parent_batch(self, parent_ids):
+        return self.sync_page(parent_ids[0])
 
     def sync_page(self, parent_id):
         """ListMemberships use id to paginate through, so we override ChildStream
@@ -760,6 +1247,24 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
             self.update_bookmark("id", rec["id"])
             yield rec
 
+    def next_update(self, params):
+        """updated_at of a membership updated after the empty window `params`
+        asks for, found with a single probe, or None if there is none.
+
+        Memberships can't be sorted by updated_at, so the probe can't tell
+        where the next update is, only that the windows up to the one it
+        returns can be walked without probing again.
+        """
+        probe_params = {**params, "updated_after": params["updated_before"]}
+        probe_params.pop("updated_before")
+        probe_params.pop("offset", None)
+        try:
+            record = self.probe("post", probe_params)
+        except exceptions.TapPardotGatewayTimeoutException:
+            LOGGER.warning("Gateway timeout probing for membership updates")
+            return format_datetime(datetime.now())
+        return record and record["updated_at"]
+
     def get_records(self, parent_id):
         """ListMemberships can be super heavy apparently, so we need to partition requests by date to mitigate"""
         params = {
@@ -767,21 +1272,46 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
             **self.get_params(),
         }
 
+        # Membership updated at or after which a probe found, if any.
+        next_update = None
+
         while True:
             if is_after(params.get("updated_after"), datetime.now()):
                 return
 
-            data = self.client.post(self.endpoint, **params)
+            try:
+                result, records = self.request_page("post", params)
+            except exceptions.TapPardotGatewayTimeoutException:
+                updated_before = window_midpoint(
+                    params["updated_after"], params["updated_before"]
+                )
+                if updated_before is None:
+                    raise
+                LOGGER.warning(
+                    "Gateway timeout, reducing window to %s - %s",
+                    params["updated_after"],
+                    updated_before,
+                )
+                params["updated_before"] = updated_before
+                params.pop("offset", 0)
+                continue
 
-            result = data.get("result", {})
-            records = result.get(self.data_key, [])
-            total_results = result.get("total_results", 0)
+            total_results = int(result.get("total_results") or 0)
             offset = params.get("offset", 0)
 
-            if total_results > offset and len(records) >= PAGE_SIZE:
-                params["offset"] = offset + PAGE_SIZE
+            if records and total_results > offset + len(records):
+                params["offset"] = offset + len(records)
             else:
                 updated_before = params.get("updated_before")
+                if (
+                    not records
+                    and not offset
+                    and not is_after(updated_before, datetime.now())
+                    and (next_update is None or next_update <= updated_before)
+                ):
+                    next_update = self.next_update(params)
+                    if next_update is None:
+                        return
                 params["updated_after"] = updated_before
                 params["updated_before"] = add_timedelta(
                     updated_before, timedelta(days=60)
@@ -789,32 +1319,9 @@ class ListMemberships(ChildStream, NoUpdatedAtSortingStream):
                 # params["updated_after"] = add_timedelta(params.get("updated_after"), timedelta(days=7))
                 params.pop("offset", 0)
 
-            if isinstance(records, dict):
-                records = [records]
-
             yield from records
 
 
-def add_timedelta(dt_string: str, td: timedelta) -> str:
-    try:
-        dt = datetime.strptime(dt_string, "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        dt = datetime.strptime(dt_string, "%Y-%m-%d")
-
-    dt = dt + td
-
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
-
-
-def is_after(dt_string: str, target_dt: datetime):
-    try:
-        dt = datetime.strptime(dt_string, "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        dt = datetime.strptime(dt_string, "%Y-%m-%d")
-
-    return dt > target_dt
-
-
 class Campaigns(UpdatedAtSortByIdReplicationStream):
     stream_name = "campaigns"
     data_key = "campaign"
@@ -822,29 +1329,3 @@ class Campaigns(UpdatedAtSortByIdReplicationStream):
 
     is_dynamic = False
 
-
-STREAM_OBJECT_MAP = {
-    cls.stream_name: cls
-    for cls in globals().values()
-    if inspect.isclass(cls) and issubclass(cls, Stream) and cls.stream_name
-}
-STREAM_OBJECTS = [
-    (stream_name, STREAM_OBJECT_MAP.pop(stream_name))
-    for stream_name in [
-        "prospect_accounts",
-        "prospects",
-        "campaigns",
-        "visitor_activities",
-        "visits",
-        "email_clicks",
-        "opportunities",
-        "users",
-        "visitors",
-        "lists",
-        "list_memberships",
-    ]
-]
-if STREAM_OBJECT_MAP:
-    raise RuntimeError(
-        f"streams found that is not part of the ordered STREAM_OBJECTS: {list(STREAM_OBJECT_MAP.keys())}"
-    )
@@ -1,49 +1,121 @@
 import singer
 
-from .streams import STREAM_OBJECTS
-from .client import ENDPOINT_BASE, Client, parse_error
-from typing import Dict, List
+from .registry import select_streams
+from .client import Client
+from .schema import describe, get_schema, load_schema, record_transform
 
 LOGGER = singer.get_logger()
 
+PAGE_VIEWS_STREAM = "visitor_page_views"
 
-def sync(client, config, state):
-    for stream_id, stream_cls in STREAM_OBJECTS:
-        stream_object = stream_cls(client, config, state)
+
+def start_fanouts(client, config, state, parent_object, later_streams):
+    """Feed the records of `parent_object` to the spools of its child streams
+    synced later in the run, saving them a scan of the same parent pages."""
+    fanouts = []
+    for _, child_cls, _ in later_streams:
+        if getattr(child_cls, "parent_class", None) is not type(parent_object):
+            continue
+        fanout = child_cls(client, config, state).begin_fanout(
+            parent_object.get_bookmark()
+        )
+        if fanout is not None:
+            LOGGER.info(
+                "Fanning out %s into %s",
+                parent_object.stream_name,
+                child_cls.stream_name,
+            )
+            fanouts.append(fanout)
+    return fanouts
+
+
+def output_stream_id(stream_id, business_unit=None):
+    return business_unit.stream_id(stream_id) if business_unit else stream_id
+
+
+def split_page_views(stream_object, schema, business_unit=None):
+    """Write the page views of visits to the visitor_page_views stream as they
+    are read, leaving them out of the visits. Returns the visits schema."""
+    output_id = output_stream_id(PAGE_VIEWS_STREAM, business_unit)
+    page_view_schema = load_schema(PAGE_VIEWS_STREAM)
+    singer.write_schema(output_id, page_view_schema, ["id"])
+
+    def sink(page_view):
+        singer.write_record(output_id, page_view)
+
+    stream_object.page_view_sink = sink
+    properties = dict(schema["properties"])
+    properties.pop("visitor_page_views")
+    return {**schema, "properties": properties}
+
+
+def sync(
+    client, config, state, shard=None, plan=None, profiler=None, business_unit=None
+):
+    if profiler is None:
+        from .profiling import NullProfiler
+
+        profiler = NullProfiler()
+    stream_objects = select_streams(config)
+    if plan is not None:
+        from .planner import planned_streams
+
+        streams = list(planned_streams(plan, stream_objects))
+    else:
+        streams = [(stream_id, stream_cls, None) for stream_id, stream_cls in stream_objects]
+
+    for position, (stream_id, stream_cls, request_budget) in enumerate(streams):
+        if client.deadline.expired:
+            LOGGER.info(
+                "max_runtime is about to be reached, leaving %s for the next run",
+                [s[0] for s in streams[position:]],
+            )
+            break
+
+        if shard is not None and stream_cls.shard_kind is None and shard.index != 0:
+            LOGGER.info("Skipping unshardable stream %s in shard %s", stream_id, shard)
+            continue
+
+        stream_object = stream_cls(client, config, state, shard=shard)
+        stream_object.request_budget = request_budget
 
         if stream_object is None:
             raise Exception("Attempted to sync unknown stream {}".format(stream_id))
 
-        LOGGER.info("Syncing stream: " + stream_id)
+        output_id = output_stream_id(stream_id, business_unit)
+        schema = get_schema(client, stream_cls)
+        if config.get("split_page_views") and stream_id == "visits":
+            schema = split_page_views(stream_object, schema, business_unit)
+        singer.write_schema(output_id, schema, stream_cls.key_properties)
+        transform = record_transform(stream_cls, schema)
 
-        for rec in stream_object.sync():
-            singer.write_record(stream_id, rec)
+        # Children can only reuse a parent scan that runs to completion.
+        fanouts = []
+        if shard is None and request_budget is None:
+            fanouts = start_fanouts(
+                client, config, state, stream_object, streams[position + 1 :]
+            )
 
+        LOGGER.info("Syncing stream: " + output_id)
 
-def sync_properties(client: Client):
-    response = client._make_request(
-        "GET",
-        f"{ENDPOINT_BASE}prospectAccount/version/{client.api_version}/do/describe",
-        params={"format": "json"},
-    )
-    _, code = parse_error(response)
-    if code == 89:
-        # You have requested version 4 of the API, but this account must use version 3
-        client.api_version = 3
-        response = client._make_request(
-            "GET",
-            f"{ENDPOINT_BASE}prospectAccount/version/{client.api_version}/do/describe",
-            params={"format": "json"},
-        )
-    records = get_data(response.json(), ["result", "field"])
-    singer.write_records("prospectAccountFields", records)
+        with profiler.stream(output_id):
+            for rec in stream_object.sync():
+                for fanout in fanouts:
+                    fanout.add(rec)
+                singer.write_record(output_id, transform(rec))
 
+            for fanout in fanouts:
+                if stream_object.stopped_early:
+                    fanout.abandon()
+                else:
+                    fanout.finish()
 
-def get_data(data: Dict, path: List) -> Dict:
-    if (not path) or (not data):
-        return data
-    for key in path:
-        data = data.get(key, {})
-        if not data:
-            break
-    return data
+    client.request_log.summarize()
+    LOGGER.info("Transport stats: %s", client.transport_stats())
+
+
+def sync_properties(client: Client, business_unit=None):
+    records = describe(client, "prospectAccount")
+    singer.write_records(
+        output_stream_id("prospectAccountFields", business_unit), records
+    )
@@ -0,0 +1,87 @@
+"""Pardot timestamps.
+
+Bookmarks and query bounds are kept as strings in Pardot's own
+`%Y-%m-%d %H:%M:%S` format. Normalized strings have a fixed width, so they
+order chronologically and records can be compared to bookmarks without
+parsing. Anything else (the date-only or ISO 8601 `start_date`, timezone
+aware values) is normalized once.
+
+Pardot timestamps are in the timezone of the account, so timezone aware
+values (a `start_date` ending in `Z`, the `sync_start_time` of campaigns)
+are converted to `account_timezone`, UTC unless configured.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+import dateutil.parser
+import pytz
+
+_account_timezone = pytz.UTC
+
+
+def set_account_timezone(name: Optional[str]):
+    """Set the account timezone aware values are converted to, by its IANA
+    name (`America/New_York`)."""
+    global _account_timezone
+    _account_timezone = pytz.timezone(name) if name else pytz.UTC
+    parse_datetime.cache_clear()
+    normalize.cache_clear()
+
+
+def _fast_parse(value: str) -> Optional[datetime]:
+    try:
+        if len(value) == 19 and value[10] == " ":
+            return datetime(
+                int(value[0:4]),
+                int(value[5:7]),
+                int(value[8:10]),
+                int(value[11:13]),
+                int(value[14:16]),
+                int(value[17:19]),
+            )
+        if len(value) == 10:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except ValueError:
+        pass
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value: str) -> datetime:
+    """Parse a timestamp into a naive datetime in the account's timezone."""
+    dt = _fast_parse(value)
+    if dt is None:
+        dt = dateutil.parser.parse(value)
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(_account_timezone).replace(tzinfo=None)
+    return dt
+
+
+def format_datetime(dt: datetime) -> str:
+    return dt.isoformat(sep=" ", timespec="seconds")
+
+
+@lru_cache(maxsize=4096)
+def normalize(value: str) -> str:
+    """Return `value` in Pardot's format."""
+    return format_datetime(parse_datetime(value))
+
+
+def add_timedelta(value: str, td: timedelta) -> str:
+    return format_datetime(parse_datetime(value) + td)
+
+
+def window_midpoint(start: str, end: str, min_window=timedelta(hours=1)):
+    """Return the middle of [start, end], or None if the window is too small to split."""
+    start_dt = parse_datetime(start)
+    end_dt = parse_datetime(end)
+
+    if end_dt - start_dt <= min_window:
+        return None
+
+    return format_datetime(start_dt + (end_dt - start_dt) / 2)
+
+
+def is_after(value: str, target_dt: datetime) -> bool:
+    return parse_datetime(value) > target_dt
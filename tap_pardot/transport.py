@@ -0,0 +1,191 @@
+import threading
+
+import requests
+import singer
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from typing import Dict, Optional, Tuple
+
+LOGGER = singer.get_logger()
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_TRANSPORT_RETRIES = 3
+
+# Statuses that are safe to retry at the transport level. Pardot sends a
+# Retry-After header along with these, which urllib3 honours for us. 429 is
+# left to the client, so that the concurrency limiter sees the rejection and
+# the retries count against the request quota.
+RETRY_STATUSES = (503,)
+
+
+class TransportStats:
+    """Counters used to verify connection reuse and compression savings."""
+
+    def __init__(self):
+        self.requests = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.lock = threading.Lock()
+
+    def record(self, response: requests.Response):
+        body_bytes = len(response.content)
+
+        raw = response.raw
+        wire_bytes = None
+        if raw is not None and hasattr(raw, "tell"):
+            try:
+                wire_bytes = raw.tell()
+            except (OSError, ValueError):
+                wire_bytes = None
+        # tell() reports 0 for bodies urllib3 has not counted (e.g. mocked
+        # responses), in which case we cannot claim any savings.
+        with self.lock:
+            self.requests += 1
+            self.body_bytes += body_bytes
+            self.wire_bytes += wire_bytes or body_bytes
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.body_bytes - self.wire_bytes)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter applying a default (connect, read) timeout to every request,
+    so a hung socket surfaces as a requests Timeout instead of blocking forever."""
+
+    def __init__(self, timeout: Tuple[float, float], *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or self.timeout, **kwargs)
+
+    def connection_stats(self) -> Dict[str, int]:
+        connections = 0
+        pooled_requests = 0
+        for pool in self.poolmanager.pools._container.values():
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+        return {"connections_opened": connections, "pooled_requests": pooled_requests}
+
+
+class HTTP2Adapter(BaseAdapter):
+    """Transport adapter speaking HTTP/2 through httpx, an optional dependency
+    (`pip install tap-pardot[http2]`)."""
+
+    def __init__(self, timeout: Tuple[float, float], pool_size: int):
+        super().__init__()
+        import httpx
+
+        self.timeout = timeout
+        self.client = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        self._httpx = httpx
+        self._connections = set()
+        self._requests = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        httpx = self._httpx
+        try:
+            resp = self.client.request(
+                request.method,
+                request.url,
+                headers=dict(request.headers),
+                content=request.body,
+            )
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        self._requests += 1
+        stream_info = resp.extensions.get("network_stream")
+        if stream_info is not None:
+            self._connections.add(id(stream_info))
+
+        response = requests.Response()
+        response.status_code = resp.status_code
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.headers.pop("content-encoding", None)
+        response._content = resp.content
+        response.encoding = resp.encoding
+        response.url = str(resp.url)
+        response.reason = resp.reason_phrase
+        response.request = request
+        response.connection = self
+        response.raw = _HTTP2Raw(resp.num_bytes_downloaded)
+        return response
+
+    def close(self):
+        self.client.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        return {
+            "connections_opened": len(self._connections),
+            "pooled_requests": self._requests,
+        }
+
+
+class _HTTP2Raw:
+    """Minimal stand-in for urllib3's response, exposing the wire byte count."""
+
+    def __init__(self, num_bytes: int):
+        self._num_bytes = num_bytes
+
+    def tell(self) -> int:
+        return self._num_bytes
+
+
+def build_session(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    transport_retries: int = DEFAULT_TRANSPORT_RETRIES,
+    http2: bool = False,
+) -> Tuple[requests.Session, BaseAdapter]:
+    """Build a requests session with a keep-alive pool sized for `pool_size`
+    concurrent requests, default timeouts, Retry-After aware retries and
+    gzip negotiation."""
+    session = requests.Session()
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    timeout = (float(connect_timeout), float(read_timeout))
+
+    adapter: Optional[BaseAdapter] = None
+    if http2:
+        try:
+            adapter = HTTP2Adapter(timeout, int(pool_size))
+        except ImportError:
+            LOGGER.warning(
+                "http2 requested but httpx[http2] is not installed, falling back to HTTP/1.1"
+            )
+
+    if adapter is None:
+        retry = Retry(
+            total=int(transport_retries),
+            connect=int(transport_retries),
+            read=0,
+            status=int(transport_retries),
+            status_forcelist=RETRY_STATUSES,
+            method_whitelist=frozenset(["GET", "POST"]),
+            backoff_factor=1,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = TimeoutHTTPAdapter(
+            timeout,
+            pool_connections=int(pool_size),
+            pool_maxsize=int(pool_size),
+            max_retries=retry,
+        )
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, adapter
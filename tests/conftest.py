@@ -0,0 +1,92 @@
+import io
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from tap_pardot.client import Client
+
+
+class FakeAPI(BaseAdapter):
+    """Answers every request with `handler(method, path, params)`, a
+    `(status, body)` pair, recording the requests made."""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+        self.calls = []
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if request.body:
+            body = request.body
+            if isinstance(body, bytes):
+                body = body.decode()
+            params.update({k: v[0] for k, v in parse_qs(body).items()})
+        self.calls.append((request.method, url.path, params))
+        status, body = self.handler(request.method, url.path, params)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers["content-type"] = "application/json"
+        response._content = json.dumps(body).encode()
+        response.raw = io.BytesIO(response._content)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+    def connection_stats(self):
+        return {}
+
+
+def query_handler(data_key, records, page_size=200):
+    """Handler filtering `records` on the created/updated/id bounds of the
+    query, then sorting and paging them like Pardot."""
+    bounds = {
+        "created_after": lambda r, v: r["created_at"] > v,
+        "created_before": lambda r, v: r["created_at"] < v,
+        "updated_after": lambda r, v: r["updated_at"] > v,
+        "updated_before": lambda r, v: r["updated_at"] < v,
+        "id_greater_than": lambda r, v: r["id"] > int(v),
+        "id_less_than": lambda r, v: r["id"] < int(v),
+    }
+
+    def handler(method, path, params):
+        if path.endswith("/describe"):
+            return 200, {"result": {"field": []}}
+        result = list(records)
+        for key, matches in bounds.items():
+            if key in params:
+                result = [r for r in result if matches(r, params[key])]
+        if "sort_by" in params:
+            result.sort(
+                key=lambda r: r[params["sort_by"]],
+                reverse=params.get("sort_order") == "descending",
+            )
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", page_size)), page_size)
+        page = result[offset : offset + limit]
+        return 200, {"result": {"total_results": len(result), data_key: page}}
+
+    return handler
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Build a client answered by a FakeAPI, returning both."""
+    monkeypatch.setattr(Client, "_set_limit", lambda self: None)
+
+    def build(handler, **kwargs):
+        client = Client("business_unit", "id", "secret", "token", "access", **kwargs)
+        api = FakeAPI(handler)
+        client.requests_session.mount("https://", api)
+        client.transport_adapter = api
+        return client, api
+
+    return build
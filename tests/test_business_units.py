@@ -0,0 +1,85 @@
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+
+import pytest
+import singer
+
+import tap_pardot
+from tap_pardot.business_units import SerializedOutput, get_business_units
+from tap_pardot.client import TOKEN_URL, Client
+
+CONFIG = {
+    "start_date": "2024-01-01",
+    "client_id": "id",
+    "client_secret": "secret",
+    "refresh_token": "token",
+    "access_token": "access",
+    "business_units": {"good": "BU1", "bad": "BU2"},
+}
+
+
+def test_failing_unit_stops_the_others_and_exits(monkeypatch):
+    monkeypatch.setattr(Client, "_set_limit", lambda self: None)
+    started = threading.Event()
+    stopped = []
+
+    def sync_business_unit(client, config, state, tap_args, shard, profiler, unit):
+        if unit.name == "bad":
+            started.wait(5)
+            sys.exit(5)
+        started.set()
+        deadline = time.monotonic() + 5
+        while not client.deadline.expired and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stopped.append(client.deadline.expired)
+
+    monkeypatch.setattr(tap_pardot, "sync_business_unit", sync_business_unit)
+    units = get_business_units(CONFIG)
+    tap_args = argparse.Namespace(plan=False, follow=False)
+
+    with pytest.raises(SystemExit) as exc_info:
+        tap_pardot.sync_business_units(units, CONFIG, {}, tap_args, None, None)
+
+    assert exc_info.value.code == 5
+    assert stopped == [True]
+
+
+def test_units_share_a_token_manager_with_timeouts(monkeypatch):
+    monkeypatch.setattr(Client, "_set_limit", lambda self: None)
+    token_managers = []
+
+    def sync_business_unit(client, config, state, tap_args, shard, profiler, unit):
+        token_managers.append(client.token_manager)
+
+    monkeypatch.setattr(tap_pardot, "sync_business_unit", sync_business_unit)
+    config = {**CONFIG, "connect_timeout": 5, "read_timeout": 30}
+    units = get_business_units(config)
+    tap_args = argparse.Namespace(plan=False, follow=False)
+
+    tap_pardot.sync_business_units(units, config, {}, tap_args, None, None)
+
+    assert len(token_managers) == 2 and token_managers[0] is token_managers[1]
+    adapter = token_managers[0].session.get_adapter(TOKEN_URL)
+    assert adapter.timeout == (5.0, 30.0)
+
+
+def test_concurrent_messages_do_not_interleave(monkeypatch):
+    output = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", SerializedOutput(output))
+
+    def write(stream):
+        for i in range(200):
+            singer.write_record(stream, {"id": i, "padding": "x" * 1000})
+
+    threads = [threading.Thread(target=write, args=(f"s{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    messages = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(messages) == 800
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import backoff
+
+from tap_pardot.client import Client, RateLimitException, default_limit
+from tap_pardot.streams import Prospects
+
+from conftest import query_handler
+
+CONFIG = {"start_date": "2024-01-01T00:00:00Z"}
+
+
+def test_gateway_timeouts_are_retried_outside_windowed_streams(
+    fake_client, monkeypatch
+):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    answer = query_handler("prospect", [{"id": 1, "updated_at": "2024-02-01"}])
+    timeouts = [504]
+
+    def handler(method, path, params):
+        if timeouts:
+            return timeouts.pop(), {"err": "Gateway Timeout"}
+        return answer(method, path, params)
+
+    client, api = fake_client(handler)
+    _, records = Prospects(client, CONFIG, {}).request_page("get", {})
+
+    assert [record["id"] for record in records] == [1]
+    assert len(api.calls) == 2
+    assert client.retry_budget.spent == 1
+
+
+def test_retrying_senders_are_built_once(fake_client, monkeypatch):
+    client, api = fake_client(query_handler("prospect", []))
+
+    def rebuilt(*args, **kwargs):
+        raise AssertionError("backoff decorator built per request")
+
+    monkeypatch.setattr(backoff, "on_exception", rebuilt)
+    client.get("prospect")
+    client.get("prospect", retry_timeouts=False)
+
+    assert len(api.calls) == 2
+
+
+def test_failed_limits_fetch_falls_back_to_the_default_limit(monkeypatch):
+    def fail(self):
+        raise RateLimitException("quota")
+
+    monkeypatch.setattr(Client, "_set_limit", fail)
+    client = Client("business_unit", "id", "secret", "token", "access")
+
+    assert client.request_limit == default_limit()
+    assert client.request_limit == default_limit()
+
+
+def test_limits_are_published_once_fetched(monkeypatch):
+    release = threading.Event()
+
+    def set_limit(self):
+        release.wait(5)
+        self.request_limit = 1234
+
+    monkeypatch.setattr(Client, "_set_limit", set_limit)
+    client = Client("business_unit", "id", "secret", "token", "access")
+    threading.Timer(0.05, release.set).start()
+
+    assert client.request_limit == 1234
+
+
+def test_transport_leaves_429_to_the_client():
+    from tap_pardot.transport import build_session
+
+    _, adapter = build_session()
+    assert 429 not in adapter.max_retries.status_forcelist
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from tap_pardot.retry import ConcurrencyLimiter
+
+from conftest import query_handler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rejection_halves_the_limit_once_per_round():
+    clock = Clock()
+    limiter = ConcurrencyLimiter(maximum=8, clock=clock)
+    starts = [limiter.acquire() for _ in range(3)]
+
+    clock.now = 1.0
+    limiter.release(starts[0], concurrency_error=True)
+    assert limiter.current == 4
+    # Requests already in flight when the limit was halved don't halve it again.
+    limiter.release(starts[1], concurrency_error=True)
+    assert limiter.current == 4
+
+    clock.now = 1.5
+    start = limiter.acquire()
+    clock.now = 2.0
+    limiter.release(start, concurrency_error=True)
+    assert limiter.current == 2
+    limiter.release(starts[2])
+
+
+def test_limit_grows_back_on_fast_successes():
+    clock = Clock()
+    limiter = ConcurrencyLimiter(maximum=4, clock=clock)
+    limiter.limit = 1.0
+
+    for _ in range(6):
+        start = limiter.acquire()
+        clock.now += 0.1
+        limiter.release(start)
+
+    assert limiter.current == 3
+    for _ in range(20):
+        start = limiter.acquire()
+        clock.now += 0.1
+        limiter.release(start)
+    assert limiter.current == 4
+
+
+def test_slow_responses_do_not_grow_the_limit():
+    clock = Clock()
+    limiter = ConcurrencyLimiter(maximum=4, latency_tolerance=3.0, clock=clock)
+    start = limiter.acquire()
+    clock.now += 0.1
+    limiter.release(start)
+    limiter.limit = 1.0
+
+    start = limiter.acquire()
+    clock.now += 1.0
+    limiter.release(start)
+    assert limiter.limit == 1.0
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = ConcurrencyLimiter(maximum=1)
+    start = limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.release(limiter.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+    assert limiter.in_flight == 1
+
+    limiter.release(start)
+    assert acquired.wait(5)
+    thread.join()
+    assert limiter.in_flight == 0
+
+
+def test_pardot_concurrency_errors_halve_the_limit(fake_client, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    answer = query_handler("prospect", [])
+    rejections = [66]
+
+    def handler(method, path, params):
+        if rejections:
+            rejections.pop()
+            error = "Exceeded the concurrent API request limit"
+            return 400, {"err": error, "@attributes": {"err_code": 66}}
+        return answer(method, path, params)
+
+    limiter = ConcurrencyLimiter(maximum=4)
+    client, api = fake_client(handler, concurrency_limiter=limiter)
+    client.get("prospect")
+
+    assert len(api.calls) == 2
+    assert limiter.current == 2
+    assert client.circuit_breaker.failures == 0
@@ -0,0 +1,195 @@
+import json
+import os
+
+import pytest
+from conftest import query_handler
+
+from tap_pardot.spool import IdSpool
+from tap_pardot.streams import ParentFanOut, Visits
+from tap_pardot.sync import sync
+
+VISITORS = [
+    {"id": i, "updated_at": f"2024-01-0{i} 00:00:00", "created_at": "2024-01-01"}
+    for i in range(1, 6)
+]
+VISITS = [
+    {"id": 100 + i, "visitor_id": i, "updated_at": "2024-02-01 00:00:00"}
+    for i in range(1, 6)
+]
+
+
+def visit_handler(visitors, visits, on_visitors=None):
+    """Answer visitor queries 2 records a page and visit queries for the
+    requested visitor_ids."""
+    visitor_handler = query_handler("visitor", visitors, page_size=2)
+
+    def handler(method, path, params):
+        if path.split("/")[2] == "visitor":
+            if on_visitors is not None:
+                on_visitors()
+            return visitor_handler(method, path, params)
+        ids = {int(i) for i in params["visitor_ids"].split(",")}
+        result = [v for v in visits if v["visitor_id"] in ids]
+        offset = int(params.get("offset", 0))
+        page = result[offset : offset + int(params["limit"])]
+        return 200, {"result": {"total_results": len(result), "visit": page}}
+
+    return handler
+
+
+def parent_state(updated_at):
+    return {"bookmarks": {"visitors": {"updated_at": updated_at}}}
+
+
+def spooled(tmp_path, ids, **spool_state):
+    """A visits state with a spool of `ids` left by a previous run."""
+    spool = IdSpool(str(tmp_path / "previous.ids"))
+    spool.create()
+    spool.append(ids)
+    return {
+        "bookmarks": {
+            "visitors": {"updated_at": "2024-01-02 00:00:00"},
+            "visits": {
+                "updated_at": "2024-01-01 00:00:00",
+                "parent_bookmark": parent_state("2024-01-02 00:00:00"),
+                "spool": {
+                    "path": spool.path,
+                    "count": len(ids),
+                    "complete": True,
+                    "parent_start": parent_state("2024-01-01 00:00:00"),
+                    **spool_state,
+                },
+            },
+        }
+    }
+
+
+def synced_visits(capsys):
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return sorted(
+        line["record"]["id"]
+        for line in lines
+        if line["type"] == "RECORD" and line["stream"] == "visits"
+    )
+
+
+def config(tmp_path):
+    return {
+        "start_date": "2024-01-01 00:00:00",
+        "spool_dir": str(tmp_path),
+        "streams": ["visitors", "visits"],
+    }
+
+
+def test_parent_stopped_by_the_deadline_drops_the_fanout(
+    fake_client, tmp_path, capsys
+):
+    client, api = fake_client(None)
+    api.handler = visit_handler(
+        VISITORS, VISITS, on_visitors=client.deadline.expire
+    )
+    state = {}
+
+    sync(client, config(tmp_path), state)
+
+    assert state["bookmarks"]["visitors"]["updated_at"] == "2024-01-03 00:00:00"
+    assert "spool" not in state["bookmarks"]["visits"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_open_spool_drops_ids_past_the_recorded_count(fake_client, tmp_path):
+    client, _ = fake_client(None)
+    state = spooled(tmp_path, [2, 3, 4], count=2)
+    visits = Visits(client, config(tmp_path), state, emit=False)
+    visits.pre_sync()
+
+    spool = visits.open_spool()
+
+    assert spool.path == str(tmp_path / "previous.ids")
+    assert [list(ids) for _, ids in spool.chunks(10)] == [[2, 3]]
+
+
+def test_open_spool_rescans_when_the_spool_is_gone(fake_client, tmp_path):
+    client, _ = fake_client(None)
+    state = spooled(tmp_path, [2])
+    os.remove(tmp_path / "previous.ids")
+    state["bookmarks"]["visits"]["spool_position"] = 1
+    visits = Visits(client, config(tmp_path), state, emit=False)
+    visits.pre_sync()
+
+    spool = visits.open_spool()
+
+    bookmarks = state["bookmarks"]["visits"]
+    assert len(spool) == 0
+    assert bookmarks["spool"]["path"] == spool.path != str(tmp_path / "previous.ids")
+    assert bookmarks["parent_bookmark"] == parent_state("2024-01-01 00:00:00")
+    assert "spool_position" not in bookmarks
+
+
+def test_spool_parent_ids_stops_at_the_fanout_bound(fake_client, tmp_path):
+    client, _ = fake_client(visit_handler(VISITORS, VISITS))
+    state = spooled(
+        tmp_path,
+        [],
+        complete=False,
+        fanout={"until": "2024-01-03 00:00:00", "complete": True},
+    )
+    state["bookmarks"]["visits"]["parent_bookmark"] = parent_state(
+        "2024-01-01 00:00:00"
+    )
+    visits = Visits(client, config(tmp_path), state, emit=False)
+    visits.pre_sync()
+    spool = visits.open_spool()
+
+    visits.spool_parent_ids(spool)
+
+    assert [list(ids) for _, ids in spool.chunks(10)] == [[2, 3]]
+    assert state["bookmarks"]["visits"]["spool"]["count"] == 2
+    assert state["bookmarks"]["visits"]["spool"]["complete"]
+
+
+def test_parent_fanout_spools_records_after_the_scan_start(fake_client, tmp_path):
+    client, _ = fake_client(None)
+    state = spooled(tmp_path, [], fanout={"until": None, "complete": False})
+    visits = Visits(client, config(tmp_path), state, emit=False)
+    spool = IdSpool(state["bookmarks"]["visits"]["spool"]["path"])
+    fanout = ParentFanOut(visits, spool, "2024-01-02 00:00:00")
+    fanout.flush_size = 2
+
+    for visitor in VISITORS:
+        fanout.add(visitor)
+    assert len(spool) == 2
+    fanout.finish()
+
+    assert [list(ids) for _, ids in spool.chunks(10)] == [[3, 4, 5]]
+    assert state["bookmarks"]["visits"]["spool"]["count"] == 3
+    assert state["bookmarks"]["visits"]["spool"]["fanout"]["complete"]
+
+
+def test_child_reuses_the_parent_scan(fake_client, tmp_path, capsys):
+    client, api = fake_client(visit_handler(VISITORS, VISITS))
+
+    sync(client, config(tmp_path), {})
+
+    assert synced_visits(capsys) == [102, 103, 104, 105]
+    visitor_queries = [c for c in api.calls if c[1].split("/")[2] == "visitor"]
+    assert len(visitor_queries) == 3
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(
+    "parent_bookmark",
+    # The parent may have been synced on its own since the spool was scanned.
+    ["2024-01-02 00:00:00", "2024-01-03 00:00:00"],
+)
+def test_resumed_spool_takes_the_parents_synced_in_this_run(
+    fake_client, tmp_path, capsys, parent_bookmark
+):
+    client, _ = fake_client(visit_handler(VISITORS, VISITS))
+    state = spooled(tmp_path, [2], fanout={"until": "2024-01-01", "complete": True})
+    state["bookmarks"]["visitors"]["updated_at"] = parent_bookmark
+
+    sync(client, config(tmp_path), state)
+
+    assert synced_visits(capsys) == [102, 103, 104, 105]
+    assert "spool" not in state["bookmarks"]["visits"]
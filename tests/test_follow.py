@@ -0,0 +1,84 @@
+import json
+import sys
+
+import pytest
+
+from tap_pardot.follow import Follower, PollInterval, follow
+
+from conftest import query_handler
+
+CONFIG = {"start_date": "2024-01-01T00:00:00Z"}
+FOLLOW_CONFIG = {
+    **CONFIG,
+    "follow_streams": ["prospects"],
+    "follow_min_interval": 0.01,
+    "follow_max_interval": 0.04,
+}
+
+
+def prospect(id, updated_at):
+    return {"id": id, "updated_at": updated_at}
+
+
+def test_records_of_the_last_second_are_not_emitted_again(fake_client, capsys):
+    records = [prospect(1, "2024-02-01 10:00:00"), prospect(2, "2024-02-01 10:00:00")]
+    client, _ = fake_client(query_handler("prospect", records))
+    follower = Follower(client, CONFIG, {}, "prospects")
+
+    assert follower.poll() == 2
+    assert follower.poll() == 0
+
+    records.append(prospect(3, "2024-02-01 10:00:00"))
+    assert follower.poll() == 1
+
+    messages = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    ids = [m["record"]["id"] for m in messages if m["type"] == "RECORD"]
+    assert ids == [1, 2, 3]
+
+
+def test_poll_interval_adapts_to_new_records():
+    interval = PollInterval(30, 600)
+
+    assert [interval.update(n) for n in (0, 0, 0, 0, 0, 5, 5, 5)] == [
+        60,
+        120,
+        240,
+        480,
+        600,
+        300,
+        150,
+        75,
+    ]
+
+
+def test_failed_poll_is_retried_at_the_next_one(fake_client, capsys):
+    handle = query_handler("prospect", [prospect(1, "2024-02-01 10:00:00")])
+    polls = []
+
+    def handler(method, path, params):
+        if "/prospect/" not in path:
+            return handle(method, path, params)
+        polls.append(path)
+        if len(polls) == 1:
+            raise RuntimeError("connection dropped")
+        if len(polls) == 3:
+            client.deadline.expire()
+        return handle(method, path, params)
+
+    client, _ = fake_client(handler)
+    client.retry_budget.spent = client.retry_budget.budget
+
+    follow(client, FOLLOW_CONFIG, {})
+
+    messages = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [m["record"]["id"] for m in messages if m["type"] == "RECORD"] == [1]
+    assert not client.retry_budget.exhausted
+
+
+def test_invalid_credentials_still_end_follow_mode(fake_client, monkeypatch):
+    client, _ = fake_client(query_handler("prospect", []))
+    monkeypatch.setattr(Follower, "poll", lambda self: sys.exit(5))
+
+    with pytest.raises(SystemExit) as exc_info:
+        follow(client, FOLLOW_CONFIG, {})
+    assert exc_info.value.code == 5
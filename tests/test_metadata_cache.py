@@ -0,0 +1,65 @@
+import json
+
+from tap_pardot.business_units import write_state
+from tap_pardot.metadata_cache import MetadataCache
+
+
+def state_messages(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    return [json.loads(line)["value"] for line in lines]
+
+
+def test_cache_is_only_written_with_the_state_on_save(capsys):
+    state = {
+        "bookmarks": {"prospects": {"id": 1}},
+        "metadata_cache": {"bu": {"api_version": 3}},
+    }
+    cache = MetadataCache.load({}, state)
+    cache.set_describe("bu", "customField", [{"id": "field"}] * 150)
+
+    write_state(state)
+    cache.save()
+    write_state(state)
+
+    during, saved, after = state_messages(capsys)
+    assert "metadata_cache" not in during
+    assert saved["metadata_cache"]["bu"]["api_version"] == 3
+    describe = saved["metadata_cache"]["bu"]["describe"]
+    assert len(describe["customField"]["fields"]) == 150
+    assert after == saved
+
+    reloaded = MetadataCache.load({}, saved)
+    assert reloaded.get_api_version("bu") == 3
+
+
+def test_file_cache_stays_out_of_the_state(tmp_path, capsys):
+    path = str(tmp_path / "cache.json")
+    state = {}
+    cache = MetadataCache.load({"metadata_cache_path": path}, state)
+    cache.set_api_version("bu", 3)
+    cache.save()
+
+    assert state == {}
+    reloaded = MetadataCache.load({"metadata_cache_path": path}, {})
+    assert reloaded.get_api_version("bu") == 3
+
+
+def test_generated_schemas_are_not_saved_with_the_state(capsys):
+    state = {"metadata_cache": {"bu": {"schemas": {"prospects": {"hash": "old"}}}}}
+    cache = MetadataCache.load({}, state)
+    cache.set_schema("bu", "prospects", "digest", {"properties": {}})
+
+    assert cache.get_schema("bu", "prospects", "digest") == {"properties": {}}
+    cache.save()
+    (saved,) = state_messages(capsys)
+    assert "schemas" not in saved["metadata_cache"]["bu"]
+
+
+def test_file_cache_keeps_generated_schemas(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = MetadataCache.load({"metadata_cache_path": path}, {})
+    cache.set_schema("bu", "prospects", "digest", {"properties": {}})
+    cache.save()
+
+    reloaded = MetadataCache.load({"metadata_cache_path": path}, {})
+    assert reloaded.get_schema("bu", "prospects", "digest") == {"properties": {}}
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+import requests
+
+from tap_pardot import exceptions
+from tap_pardot.client import PardotException, is_limit_rejection
+from tap_pardot.paging import MAX_PAGE_SIZE, PageSizer
+from tap_pardot.streams import Prospects, VisitorActivities
+
+from conftest import query_handler
+
+CONFIG = {"start_date": "2024-01-01T00:00:00Z"}
+
+
+def test_page_size_is_capped_at_pardot_maximum():
+    sizer = PageSizer.from_config({"page_size": 1000, "max_page_size": 1000}, "x")
+    assert sizer.size == sizer.maximum == MAX_PAGE_SIZE == 200
+
+    sizer.observe(200, 200, 1000, 0.1)
+    assert sizer.size == 200
+
+
+def test_limit_rejection_falls_back_to_last_good_size(fake_client):
+    answer = query_handler("prospect", [])
+
+    def handler(method, path, params):
+        if params["limit"] == "200":
+            return 400, {"err": "Invalid limit", "@attributes": {"err_code": 400}}
+        return answer(method, path, params)
+
+    client, api = fake_client(handler)
+    stream = Prospects(client, {**CONFIG, "page_size": 100}, {})
+    stream.page_sizer.last_good = 100
+    stream.page_sizer.size = 200
+
+    stream.request_page("get", {})
+
+    assert [params["limit"] for _, _, params in api.calls] == ["200", "100"]
+    assert stream.page_sizer.size == 100
+
+
+def pardot_error(code, message):
+    response = requests.Response()
+    response.status_code = 400
+    response.request = requests.Request("GET", "https://pi.pardot.com/api").prepare()
+    response.headers["content-type"] = "application/json"
+    response._content = json.dumps(
+        {"err": message, "@attributes": {"err_code": code}}
+    ).encode()
+    return PardotException(response)
+
+
+@pytest.mark.parametrize(
+    "code, message, rejected",
+    [
+        (400, "Invalid limit", True),
+        (37, "Invalid value specified for limit", True),
+        (66, "You have exceeded the concurrent request limit", False),
+        (122, "Daily API rate limit met", False),
+        (37, "The request limit for this account was exceeded", False),
+        (37, "Invalid sort_by value", False),
+    ],
+)
+def test_only_invalid_limit_errors_are_limit_rejections(code, message, rejected):
+    assert is_limit_rejection(pardot_error(code, message)) is rejected
+
+
+def test_gateway_timeout_keeps_the_page_size(fake_client):
+    def handler(method, path, params):
+        return 504, {"err": "Gateway Timeout", "@attributes": {"err_code": 504}}
+
+    client, api = fake_client(handler)
+    stream = VisitorActivities(client, CONFIG, {})
+
+    with pytest.raises(exceptions.TapPardotGatewayTimeoutException):
+        stream.request_page("get", {})
+
+    assert stream.page_sizer.size == 200
+    assert len(api.calls) == 1
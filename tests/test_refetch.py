@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from tap_pardot.exceptions import TapPardotRefetchException
+from tap_pardot.refetch import refetch
+
+from conftest import query_handler
+
+CONFIG = {"start_date": "2024-01-01T00:00:00Z", "max_concurrent_requests": 2}
+
+
+def test_refetch_reads_only_the_requested_ids(fake_client, capsys):
+    records = [{"id": i, "updated_at": "2024-02-01 00:00:00"} for i in range(1, 1000)]
+    client, api = fake_client(query_handler("prospect", records))
+
+    refetch(client, CONFIG, {"prospects": [3, "500-650", 990]})
+
+    messages = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    ids = sorted(m["record"]["id"] for m in messages if m["type"] == "RECORD")
+    assert ids == [3, *range(500, 651), 990]
+    assert not any(m["type"] == "STATE" for m in messages)
+
+
+def test_streams_queried_by_parent_ids_are_rejected(fake_client):
+    client, api = fake_client(query_handler("visit", []))
+
+    with pytest.raises(TapPardotRefetchException, match="visits"):
+        refetch(client, CONFIG, {"prospects": [1], "visits": [1]})
+    assert api.calls == []
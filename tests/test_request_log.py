@@ -0,0 +1,73 @@
+import json
+import logging
+import threading
+
+from tap_pardot.request_log import LOGGER, RequestLog
+
+URL = "https://pi.pardot.com/api/prospect/version/4/do/query"
+
+
+def events(caplog, kind):
+    prefix = f"{kind}: "
+    return [
+        json.loads(record.getMessage()[len(prefix) :])
+        for record in caplog.records
+        if record.getMessage().startswith(prefix)
+    ]
+
+
+def test_only_sampled_responses_are_logged(caplog):
+    caplog.set_level(logging.INFO, logger=LOGGER.name)
+    draws = iter([0.5, 0.001, 0.9])
+    log = RequestLog(sample_rate=0.01, rng=lambda: next(draws))
+    for status in (200, 200, 500):
+        log.response("get", URL, {"offset": 0}, status, 0.25)
+
+    assert events(caplog, "RESPONSE") == [
+        {
+            "method": "GET",
+            "url": URL,
+            "params": {"offset": 0},
+            "status": 200,
+            "seconds": 0.25,
+        }
+    ]
+
+    log.summarize()
+    assert events(caplog, "REQUEST_SUMMARY") == [
+        {
+            "method": "GET",
+            "url": URL,
+            "requests": 3,
+            "errors": 1,
+            "average_seconds": 0.25,
+        }
+    ]
+
+
+def test_summarize_while_other_threads_log():
+    log = RequestLog(interval=0, sample_rate=0)
+    stop = threading.Event()
+    errors = []
+
+    def respond(n):
+        try:
+            i = 0
+            while not stop.is_set():
+                log.response("get", f"{URL}/{n}/{i}", {}, 200, 0.1)
+                i += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=respond, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(200):
+            log.summarize()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
@@ -0,0 +1,37 @@
+import pytest
+
+from tap_pardot import retry
+
+
+@pytest.mark.parametrize(
+    "err_code, expected",
+    [
+        (1, retry.FATAL),
+        (15, retry.FATAL),
+        (66, retry.RETRYABLE),
+        (89, retry.VERSION_SWITCH),
+        (122, retry.FATAL),
+        (181, retry.FATAL),
+        (184, retry.REFRESH),
+    ],
+)
+def test_error_codes_are_classified(err_code, expected):
+    assert retry.classify(400, err_code) == expected
+
+
+def test_every_classified_code_is_tested():
+    assert set(retry.ERROR_CODE_CLASSIFICATION) == {1, 15, 66, 89, 122, 181, 184}
+
+
+@pytest.mark.parametrize(
+    "status_code, expected",
+    [
+        (401, retry.REFRESH),
+        (403, retry.FATAL),
+        (429, retry.RETRYABLE),
+        (500, retry.RETRYABLE),
+        (504, retry.GATEWAY_TIMEOUT),
+    ],
+)
+def test_unlisted_codes_fall_back_to_the_status(status_code, expected):
+    assert retry.classify(status_code, None) == expected
@@ -0,0 +1,36 @@
+from conftest import query_handler
+
+from tap_pardot.metadata_cache import MetadataCache
+from tap_pardot.schema import custom_fields, get_schema, record_transform
+from tap_pardot.streams import Prospects, Visitors
+
+SCHEMA = {"properties": {"score": {"type": ["null", "integer"]}}}
+
+
+def test_only_dynamic_streams_are_cast():
+    assert record_transform(Prospects, SCHEMA)({"score": "12"}) == {"score": 12}
+    assert record_transform(Visitors, SCHEMA)({"score": "12"}) == {"score": "12"}
+
+
+def test_cached_custom_fields_keep_only_what_the_schema_needs(fake_client):
+    fields = [
+        {
+            "id": 1,
+            "field_id": "shoe_size",
+            "name": "Shoe size",
+            "type": "Number",
+            "crm_id": "Shoe_Size__c",
+            "created_at": "2024-01-01",
+            "updated_at": "2024-01-01",
+        }
+    ]
+    cache = MetadataCache({})
+    client, _ = fake_client(query_handler("customField", fields), metadata_cache=cache)
+
+    assert custom_fields(client) == fields
+    cached = cache.get_describe("business_unit", "customField")["fields"]
+    assert cached == [
+        {"id": 1, "field_id": "shoe_size", "name": "Shoe size", "type": "Number"}
+    ]
+    schema = get_schema(client, Prospects)
+    assert schema["properties"]["shoe_size"] == {"type": ["null", "number"]}
@@ -0,0 +1,62 @@
+import pytest
+
+from tap_pardot.sharding import merge_states
+
+
+def shard_state(index, count, bookmark, complete=True, **extra):
+    return {
+        "bookmarks": {"prospects": {"updated_at": bookmark}},
+        "shards": {
+            "prospects": {
+                "index": index,
+                "count": count,
+                "start": None,
+                "end": None,
+                "complete": complete,
+            }
+        },
+        **extra,
+    }
+
+
+def test_complete_shards_keep_the_greatest_bookmark():
+    states = [
+        shard_state(1, 3, "2024-03-01 00:00:00"),
+        shard_state(0, 3, "2024-02-01 00:00:00", currently_syncing=None),
+        shard_state(2, 3, "2024-04-01 00:00:00"),
+    ]
+
+    assert merge_states(states) == {
+        "bookmarks": {"prospects": {"updated_at": "2024-04-01 00:00:00"}},
+        "currently_syncing": None,
+    }
+
+
+def test_incomplete_shards_resume_from_the_first_one():
+    states = [
+        shard_state(0, 3, "2024-02-01 00:00:00"),
+        shard_state(1, 3, "2024-02-15 00:00:00", complete=False),
+        shard_state(2, 3, "2024-03-15 00:00:00", complete=False),
+    ]
+
+    merged = merge_states(states)
+    assert merged["bookmarks"]["prospects"] == {"updated_at": "2024-02-15 00:00:00"}
+
+
+def test_missing_shard_state_is_an_error():
+    states = [shard_state(0, 3, "2024-02-01"), shard_state(2, 3, "2024-04-01")]
+
+    with pytest.raises(ValueError, match="prospects"):
+        merge_states(states)
+
+
+def test_business_units_are_merged_separately():
+    states = [
+        {"business_units": {"emea": shard_state(0, 2, "2024-02-01 00:00:00")}},
+        {"business_units": {"emea": shard_state(1, 2, "2024-03-01 00:00:00")}},
+    ]
+
+    merged = merge_states(states)
+    assert merged["business_units"]["emea"]["bookmarks"] == {
+        "prospects": {"updated_at": "2024-03-01 00:00:00"}
+    }
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from tap_pardot.exceptions import TapPardotStateStoreException
+from tap_pardot.state_store import StateStore
+
+STATE = {
+    "bookmarks": {
+        "prospects": {"updated_at": "2024-01-01 00:00:00"},
+        "visits": {"id": 12},
+    },
+    "business_units": {
+        "emea": {"bookmarks": {"users": {"id": 3}}, "metadata_cache": {"x": {}}}
+    },
+    "currently_syncing": None,
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"), keep_versions=3)
+    store.load({})
+    yield store
+    store.close()
+
+
+def rows(store, version):
+    return store.connection.execute(
+        "SELECT path, value FROM entries WHERE version = ?", (version,)
+    ).fetchall()
+
+
+def test_round_trip(store, tmp_path):
+    store.commit(STATE)
+    pointer = store.pointer()
+    store.close()
+
+    reopened = StateStore(str(tmp_path / "state.db"))
+    assert reopened.export(pointer) == STATE
+    assert reopened.load(pointer) == STATE
+    reopened.close()
+
+
+def test_commit_writes_only_changed_entries(store):
+    state = json.loads(json.dumps(STATE))
+    store.commit(state)
+    state["bookmarks"]["visits"]["id"] = 13
+    del state["business_units"]["emea"]["metadata_cache"]
+    store.commit(state)
+
+    assert sorted(rows(store, store.version)) == [
+        ('["bookmarks", "visits"]', '{"id": 13}'),
+        ('["business_units", "emea", "metadata_cache", "x"]', None),
+    ]
+    assert store.export(store.pointer()) == state
+
+
+def test_load_rolls_back_to_the_pointer(store):
+    state = json.loads(json.dumps(STATE))
+    store.commit(state)
+    confirmed = store.pointer()
+    state["bookmarks"]["visits"]["id"] = 13
+    store.commit(state)
+
+    assert store.load(confirmed) == STATE
+    assert rows(store, confirmed["state_store"]["version"] + 1) == []
+
+
+def test_superseded_versions_are_pruned(store):
+    state = json.loads(json.dumps(STATE))
+    pointers = []
+    for visit_id in range(10):
+        state["bookmarks"]["visits"]["id"] = visit_id
+        store.commit(state)
+        pointers.append(store.pointer())
+
+    (count,) = store.connection.execute(
+        "SELECT COUNT(*) FROM entries WHERE path = ?", ('["bookmarks", "visits"]',)
+    ).fetchone()
+    assert count == 4
+    assert store.export(pointers[-4])["bookmarks"]["visits"] == {"id": 6}
+    with pytest.raises(TapPardotStateStoreException):
+        store.export(pointers[-5])
+    with pytest.raises(TapPardotStateStoreException):
+        store.load(pointers[0])
@@ -0,0 +1,23 @@
+import pytest
+
+from tap_pardot import timestamps
+
+
+@pytest.fixture
+def account_timezone():
+    yield timestamps.set_account_timezone
+    timestamps.set_account_timezone(None)
+
+
+def test_naive_values_are_kept_as_account_time(account_timezone):
+    account_timezone("America/New_York")
+    assert timestamps.normalize("2024-01-01") == "2024-01-01 00:00:00"
+    assert timestamps.normalize("2024-01-01T10:00:00") == "2024-01-01 10:00:00"
+
+
+def test_aware_values_are_converted_to_account_time(account_timezone):
+    assert timestamps.normalize("2024-01-01T10:00:00Z") == "2024-01-01 10:00:00"
+
+    account_timezone("America/New_York")
+    assert timestamps.normalize("2024-01-01T10:00:00Z") == "2024-01-01 05:00:00"
+    assert timestamps.normalize("2024-07-01T10:00:00+00:00") == "2024-07-01 06:00:00"
@@ -0,0 +1,103 @@
+from tap_pardot.streams import VisitorActivities
+
+from conftest import query_handler
+
+CONFIG = {"start_date": "2024-01-01T00:00:00Z"}
+
+
+def activity(id, created_at):
+    return {"id": id, "type": 1, "visitor_id": 1, "created_at": created_at}
+
+
+def gateway_timeout():
+    return 504, {"err": "Gateway Timeout", "@attributes": {"err_code": 504}}
+
+
+def sync(client, state=None):
+    stream = VisitorActivities(client, CONFIG, state or {}, emit=False)
+    records = list(stream.sync())
+    return stream, [record["id"] for record in records]
+
+
+def window_queries(api):
+    return [
+        (params["created_after"], params.get("created_before"))
+        for _, _, params in api.calls
+        if params.get("limit") != "1"
+    ]
+
+
+def test_probe_timeout_after_split_keeps_the_unqueried_span(fake_client):
+    records = [activity(1, "2024-01-05 12:00:00")]
+    answer = query_handler("visitor_activity", records)
+    timeouts = {"2024-01-08 00:00:00", None}
+
+    def handler(method, path, params):
+        if params.get("limit") == "1":
+            bound = None
+        else:
+            bound = params.get("created_before")
+        if bound in timeouts:
+            timeouts.discard(bound)
+            return gateway_timeout()
+        return answer(method, path, params)
+
+    client, api = fake_client(handler)
+    stream, ids = sync(client)
+
+    assert ids == [1]
+    # The window after the probe timeout starts where the empty one ended.
+    assert window_queries(api)[2][0] == "2024-01-04 11:59:59"
+    assert stream.get_bookmark() == "2024-01-05 12:00:00"
+
+
+def test_empty_windows_skip_to_the_next_activity(fake_client):
+    records = [activity(1, "2024-03-01 08:00:00"), activity(2, "2024-03-02 08:00:00")]
+    client, api = fake_client(query_handler("visitor_activity", records))
+    _, ids = sync(client)
+
+    assert ids == [1, 2]
+    assert window_queries(api)[:2] == [
+        ("2024-01-01 00:00:00", "2024-01-08 00:00:00"),
+        ("2024-03-01 07:59:59", "2024-03-08 07:59:59"),
+    ]
+
+
+def test_window_grows_back_only_after_the_bookmark_moved(fake_client):
+    records = [activity(1, "2024-01-02 00:00:00")]
+    answer = query_handler("visitor_activity", records)
+    timeouts = {"2024-01-08 00:00:00"}
+
+    def handler(method, path, params):
+        if params.get("created_before") in timeouts and params.get("limit") != "1":
+            timeouts.discard(params["created_before"])
+            return gateway_timeout()
+        return answer(method, path, params)
+
+    client, api = fake_client(handler)
+    stream, ids = sync(client)
+
+    assert ids == [1]
+    assert stream.window == VisitorActivities.max_window
+    assert window_queries(api)[1] == ("2024-01-01 00:00:00", "2024-01-04 12:00:00")
+    assert window_queries(api)[2][1] == "2024-01-09 00:00:00"
+
+
+def test_activity_missed_by_the_window_is_queried_again(fake_client):
+    records = [activity(1, "2024-01-03 00:00:00")]
+    answer = query_handler("visitor_activity", records)
+    window_calls = []
+
+    def handler(method, path, params):
+        if params.get("limit") != "1":
+            window_calls.append(params)
+            if len(window_calls) == 1:
+                # A lagging index: the window query misses the activity.
+                return answer(method, path, {**params, "created_before": "2024-01-01"})
+        return answer(method, path, params)
+
+    client, api = fake_client(handler)
+    _, ids = sync(client)
+
+    assert ids == [1]
+    assert window_queries(api)[1][0] == "2024-01-02 23:59:59"